@@ -0,0 +1 @@
+""" Offline benchmarks for skeletor's hot paths """
@@ -0,0 +1,59 @@
+"""
+Compares `skeletor.proc.df_from_proj` against the original per-trial
+implementation on a synthetic experiment.
+
+    python -m benchmarks.bench_df_from_proj --trials 500 --rows 400
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import skeletor
+from benchmarks.synthetic import make_experiment
+
+
+def _df_from_proj_legacy(track_proj):
+    """ The row-by-row implementation df_from_proj used to have. """
+    results = []
+    for _, trial in track_proj.ids.iterrows():
+        res = track_proj.results([trial['trial_id']])
+        for col in track_proj.ids.columns:
+            if isinstance(trial[col], list):
+                trial[col] = str(trial[col])
+            res[col] = trial[col]
+        results.append(res)
+    return pd.concat(results)
+
+
+def _measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    out = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--trials', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=400)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        make_experiment(tmp, args.trials, args.rows)
+        track_proj = skeletor.proc.proj(proj_dir=tmp)
+        for name, fn in [('legacy', _df_from_proj_legacy),
+                         ('columnar', skeletor.proc.df_from_proj)]:
+            df, elapsed, peak = _measure(fn, track_proj)
+            print('{:>9}: {:7.3f}s  peak {:8.1f}MB  frame {:8.1f}MB'.format(
+                name, elapsed, peak / 2**20,
+                df.memory_usage(deep=True).sum() / 2**20))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Measures the per-step cost of tracking loss/top1/top5 averages, with
+AverageMeter and `.item()` as in examples/train.py versus MeterGroup.
+Uses torch CPU tensors if torch is installed, numpy scalars otherwise.
+
+    python -m benchmarks.bench_meters --steps 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from skeletor.utils import AverageMeter, MeterGroup
+
+
+def _batches(steps, kind):
+    rng = np.random.RandomState(0)
+    values = rng.rand(steps, 3).astype(np.float32)
+    if kind == 'torch':
+        import torch
+        return [tuple(torch.from_numpy(row[i:i + 1]).reshape(())
+                      for i in range(3)) for row in values]
+    return [tuple(row) for row in values]
+
+
+def average_meters(batches, batch_size):
+    """ Seconds per step with one AverageMeter per metric. """
+    losses, top1, top5 = AverageMeter(), AverageMeter(), AverageMeter()
+    start = time.perf_counter()
+    for loss, prec1, prec5 in batches:
+        losses.update(loss.item(), batch_size)
+        top1.update(prec1.item(), batch_size)
+        top5.update(prec5.item(), batch_size)
+    _ = losses.avg, top1.avg, top5.avg
+    return (time.perf_counter() - start) / len(batches)
+
+
+def meter_group(batches, batch_size):
+    """ Seconds per step with a MeterGroup, including the final read. """
+    meters = MeterGroup('loss', 'top1', 'top5')
+    start = time.perf_counter()
+    for loss, prec1, prec5 in batches:
+        meters.update(n=batch_size, loss=loss, top1=prec1, top5=prec5)
+    _ = meters.averages()
+    return (time.perf_counter() - start) / len(batches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--steps', type=int, default=100000)
+    parser.add_argument('--batch_size', type=int, default=128)
+    args = parser.parse_args()
+    try:
+        import torch  # pylint: disable=unused-import
+        kind = 'torch'
+    except ImportError:
+        kind = 'numpy'
+    batches = _batches(args.steps, kind)
+    print('{} values, {} steps'.format(kind, args.steps))
+    for name, fn in [('AverageMeter', average_meters),
+                     ('MeterGroup', meter_group)]:
+        per_step = fn(batches, args.batch_size)
+        print('{:>12}: {:6.2f}us per step'.format(name, 1e6 * per_step))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Measures the per-call overhead of `track.metric` on the training thread,
+with and without skeletor's asynchronous MetricLogger.
+
+    python -m benchmarks.bench_metric_logging --calls 20000
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+import track
+
+from skeletor.metric_logger import MetricLogger
+
+
+def _log_calls(calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        track.metric(iteration=i, epoch=i // 391, avg_train_loss=1. / (i + 1),
+                     avg_train_acc=.5, cur_train_loss=.1, cur_train_acc=.5)
+    return (time.perf_counter() - start) / calls
+
+
+def measure(calls, asynchronous, proj_dir):
+    """ Returns seconds per track.metric call as seen by the caller. """
+    with track.trial(proj_dir, None, param_map={}):
+        if not asynchronous:
+            return _log_calls(calls)
+        with MetricLogger(queue_size=calls):
+            return _log_calls(calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=20000)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, asynchronous in [('sync', False), ('async', True)]:
+            per_call = measure(args.calls, asynchronous, tmp)
+            print('{:>6}: {:6.2f}us per call'.format(name, 1e6 * per_call))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""
+Runs skeletor's benchmark suite offline on CPU and stores the results as
+JSON, optionally comparing them against an earlier run.
+
+    python -m benchmarks.run --out results.json
+    python -m benchmarks.run --baseline results.json --threshold 0.2
+
+Every case is repeated `--repeat` times and its min and median are kept.
+With `--baseline`, the run fails if the median of any case is more than
+`--threshold` (as a fraction) slower than in the baseline.
+"""
+import argparse
+import collections
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_meters import average_meters, meter_group, _batches
+from benchmarks.synthetic import make_experiment
+
+# name -> fn(args, tmp) returning seconds, filled in by `case`.
+CASES = collections.OrderedDict()
+
+
+def case(name):
+    """ Registers a benchmark case. """
+    def register(fn):
+        CASES[name] = fn
+        return fn
+    return register
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def _experiment_dir(args, tmp):
+    """ A synthetic experiment, built once and shared by the cases. """
+    path = os.path.join(tmp, 'synthetic', 'exp')
+    if not os.path.isdir(path):
+        make_experiment(path, args.trials, args.rows)
+    return path
+
+
+def _launcher_args(argv):
+    from skeletor import launcher
+    parser = argparse.ArgumentParser()
+    launcher._add_default_args(parser)  # pylint: disable=protected-access
+    return parser.parse_args(argv)
+
+
+@case('proj')
+def bench_proj(args, tmp):
+    """ seconds to load the track.Project """
+    from skeletor.proc import proj
+    return _timed(proj, proj_dir=_experiment_dir(args, tmp))
+
+
+@case('df_from_proj')
+def bench_df_from_proj(args, tmp):
+    """ seconds to flatten all trials into one frame """
+    from skeletor.proc import proj, df_from_proj
+    track_proj = proj(proj_dir=_experiment_dir(args, tmp))
+    return _timed(df_from_proj, track_proj)
+
+
+@case('df_from_proj_cached')
+def bench_df_from_proj_cached(args, tmp):
+    """ seconds for a warm reload through the results cache """
+    from skeletor.proc import proj, df_from_proj
+    track_proj = proj(proj_dir=_experiment_dir(args, tmp))
+    df_from_proj(track_proj, cache=True)
+    return _timed(df_from_proj, track_proj, cache=True)
+
+
+@case('collate')
+def bench_collate(args, tmp):
+    """ seconds for _cleanup_ray_experiments to collate ray results from 4
+    ray runs into the logroot """
+    from skeletor.launcher import _cleanup_ray_experiments
+    root = tempfile.mkdtemp(dir=tmp)
+    for run in range(4):
+        shutil.copytree(_experiment_dir(args, tmp),
+                        os.path.join(root, 'raydata', 'exp', str(run),
+                                     'logs', 'exp'))
+    run_args = _launcher_args(['exp', '--logroot',
+                               os.path.join(root, 'logs')])
+    cwd = os.getcwd()
+    os.chdir(root)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return _timed(_cleanup_ray_experiments, run_args)
+    finally:
+        os.chdir(cwd)
+
+
+def _metric_overhead(args, tmp, flags):
+    """ seconds per track.metric call inside _experiment """
+    from skeletor.launcher import _experiment
+    calls = args.calls
+    elapsed = []
+
+    def experiment_fn(_):
+        import track
+        start = time.perf_counter()
+        for i in range(calls):
+            track.metric(iteration=i, epoch=i // 391,
+                         avg_train_loss=1. / (i + 1), avg_train_acc=.5,
+                         cur_train_loss=.1, cur_train_acc=.5)
+        elapsed.append(time.perf_counter() - start)
+
+    run_args = _launcher_args(['exp', '--logroot', tempfile.mkdtemp(dir=tmp),
+                               '--metric_queue_size', str(calls)] + flags)
+    _experiment(experiment_fn, run_args)
+    return elapsed[0] / calls
+
+
+@case('metric_call')
+def bench_metric_call(args, tmp):
+    """ seconds per synchronous track.metric call """
+    return _metric_overhead(args, tmp, [])
+
+
+@case('metric_call_async')
+def bench_metric_call_async(args, tmp):
+    """ seconds per track.metric call with --async_metrics """
+    return _metric_overhead(args, tmp, ['--async_metrics'])
+
+
+@case('progress_bar')
+def bench_progress_bar(args, _):
+    """ seconds per progress_bar call, stdout not being a terminal """
+    from skeletor import utils
+    utils.report_progress_to(None)
+    calls = args.calls
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for i in range(calls):
+            utils.progress_bar(i % 391, 391, 'Loss: %.3f' % .5)
+        elapsed = time.perf_counter() - start
+    utils.report_progress_to(None)
+    return elapsed / calls
+
+
+@case('average_meter')
+def bench_average_meter(args, _):
+    """ seconds per step updating loss/top1/top5 AverageMeters """
+    return average_meters(_batches(args.calls, 'numpy'), 128)
+
+
+@case('meter_group')
+def bench_meter_group(args, _):
+    """ seconds per step updating a loss/top1/top5 MeterGroup """
+    return meter_group(_batches(args.calls, 'numpy'), 128)
+
+
+@case('rolling_window')
+def bench_rolling_window(args, _):
+    """ seconds per RollingAverageWindow update """
+    from skeletor.utils import RollingAverageWindow
+    window = RollingAverageWindow(1000)
+    calls = args.calls
+    start = time.perf_counter()
+    for i in range(calls):
+        window.update(i % 97)
+    return (time.perf_counter() - start) / calls
+
+
+@case('rolling_window_quantiles')
+def bench_rolling_window_quantiles(args, _):
+    """ seconds per update followed by a p50/p95/max read """
+    from skeletor.utils import RollingAverageWindow
+    window = RollingAverageWindow(1000)
+    for i in range(1000):
+        window.update(i % 97)
+    calls = args.calls // 10
+    start = time.perf_counter()
+    for i in range(calls):
+        window.update(i % 97)
+        window.quantile((.5, .95))
+        window.max()
+    return (time.perf_counter() - start) / calls
+
+
+_STARTUP = ('import skeletor\n'
+            'skeletor.supply_args()\n'
+            'skeletor.execute(lambda args: None)\n')
+
+
+@case('execute_startup')
+def bench_execute_startup(_, tmp):
+    """ seconds for a fresh process to run an empty single-trial experiment
+    end to end, imports included """
+    logroot = tempfile.mkdtemp(dir=tmp)
+    return _timed(subprocess.run,
+                  [sys.executable, '-c', _STARTUP, 'exp', '--logroot',
+                   logroot],
+                  check=True, stdout=subprocess.DEVNULL,
+                  stderr=subprocess.DEVNULL)
+
+
+def _meta(args):
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(), 'trials': args.trials,
+            'rows': args.rows, 'calls': args.calls, 'repeat': args.repeat}
+
+
+def run(args):
+    """ Runs the selected cases; returns the results as a dict. """
+    names = args.only or list(CASES)
+    results = collections.OrderedDict()
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in names:
+            times = [CASES[name](args, tmp) for _ in range(args.repeat)]
+            results[name] = {'min': min(times),
+                             'median': statistics.median(times),
+                             'doc': CASES[name].__doc__.strip()}
+            print('{:<26} median {:>12}  min {:>12}'.format(
+                name, _format(results[name]['median']),
+                _format(results[name]['min'])))
+    return {'meta': _meta(args), 'results': results}
+
+
+def _format(seconds):
+    for unit, scale in [('s', 1), ('ms', 1e3), ('us', 1e6)]:
+        if seconds * scale >= 1:
+            return '{:.3f}{}'.format(seconds * scale, unit)
+    return '{:.1f}ns'.format(seconds * 1e9)
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints how every case changed against `baseline` and returns the names
+    of the cases whose median got more than `threshold` slower.
+    """
+    regressions = []
+    for name, result in results['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        ratio = result['median'] / base['median']
+        slower = ratio > 1 + threshold
+        if slower:
+            regressions.append(name)
+        print('{:<26} {:>7.2f}x baseline{}'.format(
+            name, ratio, '  REGRESSION' if slower else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--out', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('--threshold', type=float, default=.2,
+                        help='fail if a case is this much slower than the '
+                        'baseline, e.g. 0.2 for 20%%')
+    parser.add_argument('--only', nargs='+', choices=list(CASES),
+                        help='only run these cases')
+    parser.add_argument('--trials', type=int, default=50,
+                        help='trials in the synthetic experiment')
+    parser.add_argument('--rows', type=int, default=400,
+                        help='records per trial in the synthetic experiment')
+    parser.add_argument('--calls', type=int, default=20000,
+                        help='calls per repeat of the per-call cases')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    results = run(args)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            sys.exit('slower than the baseline: {}'.format(
+                ', '.join(regressions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+""" Builds synthetic track experiments for benchmarking. """
+import random
+
+import track
+
+
+def make_experiment(proj_dir, trials=20, rows=500, seed=0):
+    """
+    Writes `trials` track trials into `proj_dir`, each logging `rows`
+    per-iteration records shaped like the ones in `examples/train.py`.
+    Returns the directory.
+    """
+    rng = random.Random(seed)
+    for t in range(trials):
+        param_map = {'arch': rng.choice(['ResNet18', 'ResNet50']),
+                     'lr': rng.choice([.001, .01, .1, 1.]),
+                     'batch_size': rng.choice([64, 128]),
+                     'schedule': [150, 190],
+                     'seed': t}
+        with track.trial(proj_dir, None, param_map=param_map):
+            for i in range(rows):
+                track.metric(iteration=i, epoch=i // 50,
+                             avg_train_loss=rng.random(),
+                             avg_train_acc=100 * rng.random(),
+                             cur_train_loss=rng.random(),
+                             cur_train_acc=100 * rng.random())
+            track.metric(iteration=0, epoch=rows // 50,
+                         avg_test_loss=rng.random(),
+                         avg_test_acc=100 * rng.random())
+    return proj_dir
@@ -1,16 +1,17 @@
 """ Main file to orchestrate model training! Most of the work should go here."""
 
-import os
 import time
 
 import torch
 import track
 
 import skeletor
+from skeletor.checkpoint import CheckpointManager, latest_checkpoint
 from skeletor.datasets import build_dataset, num_classes
 from skeletor.models import build_model
 from skeletor.optimizers import build_optimizer
-from skeletor.utils import AverageMeter, accuracy, progress_bar
+from skeletor.utils import (AverageMeter, MeterGroup, ClassificationMeter,
+                            accuracy, progress_bar)
 
 
 def add_train_args(parser):
@@ -29,6 +30,8 @@ def add_train_args(parser):
                         help='SGD momentum')
     parser.add_argument('--weight_decay', default=5e-4, type=float,
                         help='SGD weight decay')
+    parser.add_argument('--log_interval', default=50, type=int,
+                        help='batches between two training metric records')
     parser.add_argument('--cuda', action='store_true',
                         help='if true, use GPU!')
 
@@ -43,15 +46,22 @@ def adjust_learning_rate(epoch, optimizer, lr, schedule, decay):
     return new_lr
 
 
-def train(trainloader, model, criterion, optimizer, epoch, cuda=False):
+def _train_msg(meters):
+    avgs = meters.averages()  # one device sync
+    count = meters.count('top1')
+    return 'Loss: %.3f | Acc: %.3f%% (%d/%d)' % (
+        avgs['loss'], avgs['top1'], avgs['top1'] * count / 100, count)
+
+
+def train(trainloader, model, criterion, optimizer, epoch, cuda=False,
+          log_interval=50):
     # switch to train mode
     model.train()
 
     batch_time = AverageMeter()
     data_time = AverageMeter()
-    losses = AverageMeter()
-    top1 = AverageMeter()
-    top5 = AverageMeter()
+    # Loss and accuracy stay on the device until they are read.
+    meters = MeterGroup('loss', 'top1', 'top5')
     end = time.time()
 
     for batch_idx, (inputs, targets) in enumerate(trainloader):
@@ -67,9 +77,7 @@ def train(trainloader, model, criterion, optimizer, epoch, cuda=False):
 
         # measure accuracy and record loss
         prec1, prec5 = accuracy(outputs.data, targets.data, topk=(1, 5))
-        losses.update(loss.item(), inputs.size(0))
-        top1.update(prec1.item(), inputs.size(0))
-        top5.update(prec5.item(), inputs.size(0))
+        meters.update(n=inputs.size(0), loss=loss, top1=prec1, top5=prec5)
 
         # compute gradient and do SGD step
         optimizer.zero_grad()
@@ -80,26 +88,32 @@ def train(trainloader, model, criterion, optimizer, epoch, cuda=False):
         batch_time.update(time.time() - end)
         end = time.time()
 
-        # plot progress
-        progress_str = 'Loss: %.3f | Acc: %.3f%% (%d/%d)'\
-            % (losses.avg, top1.avg, top1.sum, top1.count)
-        progress_bar(batch_idx, len(trainloader), progress_str)
+        # plot progress (the message is only formatted when it is shown)
+        progress_bar(batch_idx, len(trainloader),
+                     lambda: _train_msg(meters))
 
+        # Reading the meters syncs the device, so only log every few
+        # batches.
+        if (batch_idx + 1) % log_interval and \
+                batch_idx + 1 < len(trainloader):
+            continue
+        avgs = meters.averages()
         iteration = epoch * len(trainloader) + batch_idx
         track.metric(iteration=iteration, epoch=epoch,
-                     avg_train_loss=losses.avg,
-                     avg_train_acc=top1.avg,
-                     cur_train_loss=loss.item(),
-                     cur_train_acc=prec1.item())
-    return (losses.avg, top1.avg)
+                     avg_train_loss=avgs['loss'],
+                     avg_train_acc=avgs['top1'],
+                     cur_train_loss=meters.val('loss'),
+                     cur_train_acc=meters.val('top1'))
+    avgs = meters.averages()
+    return (avgs['loss'], avgs['top1'])
 
 
 def test(testloader, model, criterion, epoch, cuda=False):
     batch_time = AverageMeter()
     data_time = AverageMeter()
-    losses = AverageMeter()
-    top1 = AverageMeter()
-    top5 = AverageMeter()
+    losses = MeterGroup('loss')
+    # Exact top-k accuracy over the whole test set.
+    topk = ClassificationMeter(topk=(1, 5))
 
     # switch to evaluate mode
     model.eval()
@@ -120,23 +134,23 @@ def test(testloader, model, criterion, epoch, cuda=False):
             loss = criterion(outputs, targets)
 
             # measure accuracy and record loss
-            prec1, prec5 = accuracy(outputs.data, targets.data, topk=(1, 5))
-            losses.update(loss.item(), inputs.size(0))
-            top1.update(prec1.item(), inputs.size(0))
-            top5.update(prec5.item(), inputs.size(0))
+            losses.update(n=inputs.size(0), loss=loss)
+            topk.update(outputs, targets)
 
             # measure elapsed time
             batch_time.update(time.time() - end)
             end = time.time()
 
             # plot progress
-            progress_str = 'Loss: %.3f | Acc: %.3f%% (%d/%d)'\
-                % (losses.avg, top1.avg, top1.sum, top1.count)
-            progress_bar(batch_idx, len(testloader), progress_str)
+            progress_bar(batch_idx, len(testloader),
+                         lambda: 'Loss: %.3f | Acc: %.3f%% (%d)'
+                         % (losses['loss'], topk.result()['top1'],
+                            topk.count))
+    avg_test_acc = topk.result()['top1']
     track.metric(iteration=0, epoch=epoch,
-                 avg_test_loss=losses.avg,
-                 avg_test_acc=top1.avg)
-    return (losses.avg, top1.avg)
+                 avg_test_loss=losses['loss'],
+                 avg_test_acc=avg_test_acc)
+    return (losses['loss'], avg_test_acc)
 
 
 def do_training(args):
@@ -159,33 +173,41 @@ def do_training(args):
 
     criterion = torch.nn.CrossEntropyLoss()
 
-    best_acc = 0.0
-    for epoch in range(args.epochs):
+    # Pick up where an interrupted attempt of this trial left off.
+    start_epoch = 0
+    latest = latest_checkpoint(args.resume_from)
+    if latest:
+        state = torch.load(latest)
+        model.load_state_dict(state['model'])
+        optimizer.load_state_dict(state['optimizer'])
+        start_epoch = state['epoch'] + 1
+
+    checkpoints = CheckpointManager(keep_last=3, mode='max')
+    for epoch in range(start_epoch, args.epochs):
         track.debug("Starting epoch %d" % epoch)
         args.lr = adjust_learning_rate(epoch, optimizer, args.lr, args.schedule,
                                        args.gamma)
         train_loss, train_acc = train(trainloader, model, criterion,
-                                      optimizer, epoch, args.cuda)
+                                      optimizer, epoch, args.cuda,
+                                      args.log_interval)
         test_loss, test_acc = test(testloader, model, criterion, epoch,
                                    args.cuda)
         track.debug('Finished epoch %d... | train loss %.3f | train acc %.3f '
                     '| test loss %.3f | test acc %.3f'
                     % (epoch, train_loss, train_acc, test_loss, test_acc))
-        # Save model
-        model_fname = os.path.join(track.trial_dir(),
-                                   "model{}.ckpt".format(epoch))
-        torch.save(model, model_fname)
-        if test_acc > best_acc:
-            best_acc = test_acc
-            best_fname = os.path.join(track.trial_dir(), "best.ckpt")
-            track.debug("New best score! Saving model")
-            torch.save(model, best_fname)
+        # Save model in the background; keeps the last 3 and best.ckpt.
+        checkpoints.save({'model': model, 'optimizer': optimizer,
+                          'epoch': epoch}, epoch, metric=test_acc)
+    checkpoints.close()
+    track.metric(iteration=args.epochs,
+                 checkpoint_stall=sum(checkpoints.stall_times),
+                 checkpoint_bytes=checkpoints.disk_usage())
 
 
 def postprocess(proj):
     df = skeletor.proc.df_from_proj(proj)
     if 'avg_test_acc' in df.columns:
-        best_trial = df.ix[df['avg_test_acc'].idxmax()]
+        best_trial = df.loc[df['avg_test_acc'].idxmax()]
         print("Trial with top accuracy:")
         print(best_trial)
 
@@ -8,6 +8,11 @@ install_requires = [
     'awscli',
 ]
 
+extras_require = {
+    # Feather/Arrow storage for skeletor.proc caches and snapshots.
+    'arrow': ['pyarrow>=0.11'],
+}
+
 with open("README.md", "r") as fh:
     long_description = fh.read()
 
@@ -20,5 +25,7 @@ setuptools.setup(name="skeletor-ml",
                  long_description_content_type="text/markdown",
                  url="https://github.com/noahgolmant/skeletor",
                  license='MIT License',
-                 packages=setuptools.find_packages(),
-                 install_requires=install_requires)
+                 packages=setuptools.find_packages(
+                     exclude=['benchmarks', 'benchmarks.*']),
+                 install_requires=install_requires,
+                 extras_require=extras_require)
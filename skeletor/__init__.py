@@ -1,6 +1,8 @@
 """Top-level structure for skeletor """
 from . import proc
-from .launcher import supply_args, supply_postprocess, execute
-__all__ = ['proc', 'supply_args', 'supply_postprocess', 'execute']
+from .launcher import (supply_args, supply_postprocess, supply_setup,
+                       setup_state, execute)
+__all__ = ['proc', 'supply_args', 'supply_postprocess', 'supply_setup',
+           'setup_state', 'execute']
 
 name = 'skeletor-ml'
@@ -0,0 +1,156 @@
+"""
+Checkpointing into the current track trial directory.
+
+`CheckpointManager.save` snapshots the state on the training thread (moving
+tensors to CPU memory) and serializes it on a background thread. Files are
+written under a temporary name and renamed into place, so a crash never
+leaves a truncated checkpoint behind. Only the last few checkpoints, plus
+the best one by some metric, are kept.
+"""
+import concurrent.futures
+import copy
+import os
+import re
+import shutil
+import time
+
+_CKPT = 'checkpoint{}.ckpt'
+_CKPT_RE = re.compile(r'^checkpoint(\d+)\.ckpt$')
+BEST = 'best.ckpt'
+
+
+def _to_cpu(obj):
+    """ Detached CPU copy of `obj`, turning modules/optimizers into their
+    state dicts. """
+    if callable(getattr(obj, 'state_dict', None)):
+        return _to_cpu(obj.state_dict())
+    if callable(getattr(obj, 'detach', None)):
+        return obj.detach().cpu().clone()
+    if isinstance(obj, dict):
+        return type(obj)((k, _to_cpu(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(_to_cpu(v) for v in obj)
+    return copy.deepcopy(obj)
+
+
+def _default_save(obj, path):
+    import torch
+    torch.save(obj, path)
+
+
+def _checkpoints(directory):
+    """ (step, path) of every numbered checkpoint in `directory`. """
+    found = []
+    for fname in os.listdir(directory):
+        match = _CKPT_RE.match(fname)
+        if match:
+            found.append((int(match.group(1)), os.path.join(directory, fname)))
+    return sorted(found)
+
+
+def latest_checkpoint(directory):
+    """
+    Path of the most recent checkpoint written by a CheckpointManager in
+    `directory` (e.g. `args.resume_from`), or None if there is none.
+    """
+    if not directory or not os.path.isdir(directory):
+        return None
+    found = _checkpoints(directory)
+    return found[-1][1] if found else None
+
+
+class CheckpointManager:
+    """
+    Writes checkpoints in the background with a retention policy.
+
+    `directory`: where to write. Defaults to the current track trial dir,
+        so the manager must then be created inside `experiment_fn`.
+    `keep_last`: how many of the most recent checkpoints to keep.
+    `mode`: 'max' or 'min', whether a larger or smaller metric is better
+        when picking the best checkpoint.
+    `save_fn(obj, path)`: serializer, `torch.save` by default.
+
+    `stall_times` holds the seconds each `save` blocked the caller.
+    """
+    def __init__(self, directory=None, keep_last=3, mode='max',
+                 save_fn=None):
+        import track
+        assert mode in ('max', 'min'), "mode must be 'max' or 'min'"
+        self.directory = directory or track.trial_dir()
+        self.keep_last = keep_last
+        self.mode = mode
+        self.save_fn = save_fn or _default_save
+        self.best = None
+        self.stall_times = []
+        self._pool = concurrent.futures.ThreadPoolExecutor(1)
+        self._pending = []
+
+    def _improves(self, metric):
+        if metric is None:
+            return False
+        if self.best is None:
+            return True
+        return metric > self.best if self.mode == 'max' else metric < self.best
+
+    def save(self, state, step, metric=None):
+        """
+        Checkpoints `state` (any mix of dicts, lists, tensors, modules and
+        optimizers) as step `step`. If `metric` is the best so far, the
+        checkpoint also becomes best.ckpt.
+        """
+        start = time.perf_counter()
+        snapshot = _to_cpu(state)
+        is_best = self._improves(metric)
+        if is_best:
+            self.best = metric
+        self._pending.append(
+            self._pool.submit(self._write, snapshot, step, is_best))
+        self.stall_times.append(time.perf_counter() - start)
+
+    def _write(self, snapshot, step, is_best):
+        path = os.path.join(self.directory, _CKPT.format(step))
+        self.save_fn(snapshot, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        if is_best:
+            best = os.path.join(self.directory, BEST)
+            # A hard link costs no extra disk space and survives retention.
+            try:
+                os.link(path, best + '.tmp')
+            except OSError:
+                shutil.copyfile(path, best + '.tmp')
+            os.replace(best + '.tmp', best)
+        found = _checkpoints(self.directory)
+        for _, old in found[:len(found) - self.keep_last]:
+            os.remove(old)
+
+    def wait(self):
+        """ Blocks until all checkpoints are written, re-raising errors. """
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        """ Waits for outstanding writes and stops the writer thread. """
+        self.wait()
+        self._pool.shutdown()
+
+    def disk_usage(self):
+        """
+        Bytes used by the checkpoints in `directory`. A best.ckpt hard
+        linked to a kept checkpoint is only counted once.
+        """
+        paths = [path for _, path in _checkpoints(self.directory)]
+        best = os.path.join(self.directory, BEST)
+        if os.path.exists(best):
+            paths.append(best)
+        files = {}
+        for path in paths:
+            st = os.stat(path)
+            files[(st.st_dev, st.st_ino)] = st.st_size
+        return sum(files.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,154 @@
+"""
+Reading sweep configs and expanding them into per-trial configs.
+
+A config is the YAML passed with `--config`. Every key is a trial param.
+At any nesting depth a value may instead be a search spec:
+
+    {'grid_search': [...]}      swept over; the sweep is the cross product
+                                of all grid_searches (as in ray tune)
+    {'choice': [...]}           one of the values, sampled
+    {'uniform': [low, high]}    float, sampled uniformly
+    {'loguniform': [low, high]} float, sampled uniformly in log space
+    {'randint': [low, high]}    int in [low, high), sampled
+
+A top-level `skeletor` block holds options for skeletor itself. The ones
+read here are `num_samples` (how many times the grid is repeated with
+fresh samples, default 1), `sampler` ('random' or 'sobol', default
+'random') and `seed`.
+
+Trials are generated lazily, so a huge sweep can be counted and previewed
+without ever materializing it.
+"""
+import copy
+import functools
+import itertools
+import math
+import operator
+import random
+
+from skeletor.error import SkeletorException
+
+_SAMPLED = ('choice', 'uniform', 'loguniform', 'randint')
+SAMPLERS = ('random', 'sobol')
+
+
+def load_config(config_file, seed=None):
+    """
+    Reads a config YAML. A top-level `skeletor` block holds options for
+    skeletor itself rather than trial params, e.g.
+
+        skeletor:
+          num_samples: 20
+          sampler: sobol
+          scheduler:
+            type: asha
+            reward_attr: avg_test_acc
+            max_t: 200
+
+    `seed`: the sampler's seed unless the block sets one. The launcher
+    passes --seed, so a sampled sweep draws the same trials on every run
+    and --resume recognizes them.
+
+    Returns (config, skeletor_options).
+    """
+    import yaml
+    with open(config_file) as f:
+        config = yaml.safe_load(f) or {}
+    options = config.pop('skeletor', None) or {}
+    options.setdefault('seed', seed)
+    return config, options
+
+
+def _spec_kind(value):
+    if isinstance(value, dict) and len(value) == 1:
+        kind = next(iter(value))
+        if kind == 'grid_search' or kind in _SAMPLED:
+            return kind
+    return None
+
+
+def _leaves(config, path=()):
+    """ (path, kind, spec) of every search spec in `config`. """
+    for key, value in config.items():
+        kind = _spec_kind(value)
+        if kind:
+            yield path + (key,), kind, value[kind]
+        elif isinstance(value, dict):
+            yield from _leaves(value, path + (key,))
+
+
+def _set_path(config, path, value):
+    for key in path[:-1]:
+        config = config[key]
+    config[path[-1]] = value
+
+
+def _sample(kind, spec, u):
+    """ Maps a uniform draw `u` in [0, 1) onto the spec's domain. """
+    if kind == 'choice':
+        return spec[min(int(u * len(spec)), len(spec) - 1)]
+    low, high = spec
+    if kind == 'uniform':
+        return low + u * (high - low)
+    if kind == 'loguniform':
+        return math.exp(math.log(low) + u * (math.log(high) - math.log(low)))
+    return min(math.floor(low + u * (high - low)), high - 1)
+
+
+def _uniform_draws(options, dims):
+    """ Endless iterator of `dims`-dimensional points in [0, 1). """
+    sampler = options.get('sampler', 'random')
+    seed = options.get('seed')
+    if sampler not in SAMPLERS:
+        raise SkeletorException('unknown sampler {!r}, choose from '
+                                '{}'.format(sampler, SAMPLERS))
+    if sampler == 'sobol' and dims:
+        try:
+            from scipy.stats import qmc
+        except ImportError as e:
+            raise SkeletorException('the sobol sampler requires scipy') from e
+        sobol = qmc.Sobol(dims, scramble=True, seed=seed)
+        while True:
+            yield [float(u) for u in sobol.random(1)[0]]
+    rng = random.Random(seed)
+    while True:
+        yield [rng.random() for _ in range(dims)]
+
+
+def count_trials(config, options=None):
+    """ Number of trials the sweep implies, without generating them. """
+    options = options or {}
+    sizes = [len(spec) for _, kind, spec in _leaves(config)
+             if kind == 'grid_search']
+    return functools.reduce(operator.mul, sizes, 1) * \
+        options.get('num_samples', 1)
+
+
+def generate_trials(config, options=None):
+    """
+    Lazily yields the resolved config of every trial in the sweep. The
+    grid is repeated `num_samples` times; within one repetition the last
+    grid_search varies fastest. Every trial gets fresh samples for the
+    sampled specs, drawn from one random or Sobol sequence.
+    """
+    options = options or {}
+    leaves = list(_leaves(config))
+    grid = [(path, spec) for path, kind, spec in leaves
+            if kind == 'grid_search']
+    sampled = [(path, kind, spec) for path, kind, spec in leaves
+               if kind != 'grid_search']
+    combos = itertools.product(range(options.get('num_samples', 1)),
+                               itertools.product(*[spec for _, spec in grid]))
+    for (_, values), draw in zip(combos,
+                                 _uniform_draws(options, len(sampled))):
+        trial = copy.deepcopy(config)
+        for (path, _), value in zip(grid, values):
+            _set_path(trial, path, value)
+        for (path, kind, spec), u in zip(sampled, draw):
+            _set_path(trial, path, _sample(kind, spec, u))
+        yield trial
+
+
+def preview(config, options=None, n=5):
+    """ The first `n` trial configs of the sweep. """
+    return list(itertools.islice(generate_trials(config, options), n))
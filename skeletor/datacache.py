@@ -0,0 +1,145 @@
+"""
+Node-local cache of decoded dataset arrays, shared by concurrent trials.
+
+The first trial to ask for a dataset builds its arrays and stores them as
+.npy files under the cache directory (in shared memory, /dev/shm, where
+available). Every other trial on the machine memory-maps the same files
+read-only, so the data is decoded once and held in RAM once no matter how
+many trials use it. Entries are evicted least-recently-used first once
+the cache grows past its size cap, by default half the size of the file
+system it lives on (for /dev/shm, a quarter of the RAM by default).
+"""
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+import numpy as np
+
+# Cache-wide lock: shared while loading an entry, exclusive while evicting.
+_CACHE_LOCK = '.lock'
+
+try:
+    import fcntl
+except ImportError:  # not on windows; concurrent builders may then race
+    fcntl = None
+
+
+def default_cache_dir():
+    """ /dev/shm/skeletor if shared memory is mounted, else a temp dir. """
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm/skeletor'
+    return os.path.join(tempfile.gettempdir(), 'skeletor_data')
+
+
+def default_max_bytes(cache_dir):
+    """ Half the size of the file system `cache_dir` is on. """
+    return shutil.disk_usage(cache_dir).total // 2
+
+
+def _entry_name(name, version):
+    digest = hashlib.sha1('{}\0{}'.format(name, version).encode('utf-8'))
+    return '{}-{}'.format(re.sub(r'[^\w.-]', '_', name),
+                          digest.hexdigest()[:12])
+
+
+def _entry_size(path):
+    return sum(os.path.getsize(os.path.join(path, f))
+               for f in os.listdir(path))
+
+
+def _load(cache_dir, entry):
+    """ The arrays of `entry`, or None if it does not exist (anymore). """
+    with _Lock(os.path.join(cache_dir, _CACHE_LOCK), shared=True):
+        if not os.path.isdir(entry):
+            return None
+        os.utime(entry)  # mark as recently used for the LRU policy
+        return {f[:-len('.npy')]: np.load(os.path.join(entry, f),
+                                          mmap_mode='r')
+                for f in os.listdir(entry) if f.endswith('.npy')}
+
+
+def _build(cache_dir, entry, build_fn):
+    tmp = tempfile.mkdtemp(prefix=os.path.basename(entry) + '.tmp',
+                           dir=cache_dir)
+    try:
+        for key, array in build_fn().items():
+            np.save(os.path.join(tmp, key + '.npy'),
+                    np.ascontiguousarray(array))
+        os.rename(tmp, entry)
+    finally:
+        # Only left over if the build failed.
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _evict(cache_dir, max_bytes, keep):
+    """ Removes least recently used entries until under `max_bytes`. """
+    with _Lock(os.path.join(cache_dir, _CACHE_LOCK)):
+        entries = []
+        for fname in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, fname)
+            if os.path.isdir(path) and '.tmp' not in fname:
+                entries.append((os.stat(path).st_mtime, path,
+                                _entry_size(path)))
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            # Trials that already mapped the files keep their data; the
+            # pages are only freed once the last of them lets go.
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+class _Lock:
+    def __init__(self, path, shared=False):
+        self.path = path
+        self.shared = shared
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.path, 'a')
+        if fcntl:
+            fcntl.flock(self._f, fcntl.LOCK_SH if self.shared
+                        else fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._f, fcntl.LOCK_UN)
+        self._f.close()
+
+
+def cached_arrays(name, build_fn, version='0', cache_dir=None,
+                  max_bytes=None):
+    """
+    Returns the arrays of dataset `name` as a dict of read-only,
+    memory-mapped numpy arrays.
+
+    `build_fn()`: returns a dict of array name -> numpy array. It is only
+        called if no trial on this machine has built the entry yet.
+    `version`: bump this whenever the decoding or transforms change, so a
+        stale entry is not reused.
+    `cache_dir`: defaults to `default_cache_dir()`.
+    `max_bytes`: after a build, least recently used entries are evicted
+        until the cache fits. Defaults to `default_max_bytes(cache_dir)`.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    if max_bytes is None:
+        max_bytes = default_max_bytes(cache_dir)
+    entry = os.path.join(cache_dir, _entry_name(name, version))
+    # An entry can be evicted by another trial before we get to load it,
+    # in which case it is simply built again.
+    while True:
+        arrays = _load(cache_dir, entry)
+        if arrays is not None:
+            return arrays
+        with _Lock(entry + '.lock'):
+            # Another trial may have built it while we waited for the lock.
+            if not os.path.isdir(entry):
+                _build(cache_dir, entry, build_fn)
+                _evict(cache_dir, max_bytes, keep=entry)
@@ -3,17 +3,34 @@ This file orchestrates experiment launching
 
 """
 import argparse
+import concurrent.futures
+import contextlib
+import errno
+import functools
+import importlib.util
+import inspect
+import math
+import multiprocessing
+import multiprocessing.util
 import os
-import pickle
 import shutil
-import yaml
-
-import ray
-import ray.tune
-from ray.tune import register_trainable, run_experiments
-import track
-
-from skeletor.utils import seed_all
+import time
+import traceback
+
+# ray and track take seconds to import, so they are only imported on the
+# code paths that use them.
+from skeletor.config import (load_config, generate_trials, count_trials,
+                             preview)
+from skeletor.metric_logger import MetricLogger, BACKPRESSURE_POLICIES
+from skeletor.proc.index import index_experiment
+from skeletor.proc.snapshot import save_snapshot, snapshot_dir
+from skeletor.profiler import (SamplingProfiler, PROFILE_FILE,
+                               merge_profiles, top_functions)
+from skeletor.resume import (param_hash, trial_state, mark_started,
+                             mark_completed)
+from skeletor.timing import Tracer, tracing, span, read_trace, TRACE_FILE
+from skeletor.utils import (seed_all, report_progress_to, ProgressMonitor,
+                            PROGRESS_FILE)
 from skeletor.error import SkeletorException
 
 
@@ -32,8 +49,17 @@ _parser = LaunchVar()
 # This will be called after all experiments have run if it is set.
 # See `supply_postprocess`.
 _postprocess_fn = LaunchVar()
-# If set to true in `supply_postporcess`, saves the track.Project.
+# If set to true in `supply_postporcess`, snapshots the track.Project.
 _save_proj = LaunchVar()
+# Per-metric decimation policies applied before records reach track.
+# See `supply_args`.
+_metric_policies = LaunchVar()
+# Optional hook run once per process before its first trial.
+# See `supply_setup`.
+_setup_fn = LaunchVar()
+# Whatever `_setup_fn` returned in this process. See `setup_state`.
+_setup_state = LaunchVar()
+_setup_done = LaunchVar()
 
 
 def _add_default_args(parser):
@@ -59,8 +85,28 @@ def _add_default_args(parser):
                         'ray tune to launch all experiment configurations '
                         'specified by the config YAML in parallel across a '
                         'multi-gpu machine.')
-    parser.add_argument('--devices_per_trial', default=1, type=int,
-                        help='number of gpus/cpus needed per experiment')
+    parser.add_argument('--warm_workers', action='store_true',
+                        help='with --config, reuse worker processes across '
+                        'trials so imports and the `supply_setup` hook run '
+                        'once per worker instead of once per trial')
+    parser.add_argument('--dry_run', action='store_true',
+                        help='with --config, print how many trials the '
+                        'config implies and preview a few, then exit')
+    parser.add_argument('--backend', default='ray', choices=['ray', 'local'],
+                        help='how to run a --config sweep: with ray tune, '
+                        'or with a local process pool of --self_host '
+                        'workers. Falls back to local if ray is missing.')
+    parser.add_argument('--devices_per_trial', default=1, type=float,
+                        help='number of gpus needed per experiment, '
+                        'may be fractional (e.g. 0.5)')
+    parser.add_argument('--cpus_per_trial', default=None, type=float,
+                        help='number of cpus needed per experiment '
+                        '(default: 1 with --cpu, otherwise 0)')
+    parser.add_argument('--memory_per_trial', default=0, type=int,
+                        help='if >0, MB of memory reserved per experiment')
+    parser.add_argument('--trials_per_device', default=1, type=int,
+                        help='bin-pack this many light trials onto each gpu '
+                        '(or each group of --cpus_per_trial cpus with --cpu)')
     # Storage arguments
     parser.add_argument('--dataroot', default='./data', type=str,
                         help='local or absolute path where data is stored '
@@ -74,17 +120,87 @@ def _add_default_args(parser):
                         ' track records for the experiment.')
     parser.add_argument('--seed', default=1, type=int,
                         help='random seed to supply to numpy, random, torch')
-
-
-def _experiment(experiment_fn, args):
+    parser.add_argument('--resume', action='store_true',
+                        help='skip trials whose configuration already '
+                        'completed in this experiment, and point '
+                        'args.resume_from at the last attempt of trials '
+                        'that were interrupted')
+    parser.add_argument('--resume_from', default=None, type=str,
+                        help='trial directory of an interrupted attempt of '
+                        'this trial. Set automatically with --resume.')
+    # Logging arguments
+    parser.add_argument('--async_metrics', action='store_true',
+                        help='if set, track.metric only queues records and '
+                        'a background thread writes them in batches')
+    parser.add_argument('--metric_queue_size', default=10000, type=int,
+                        help='max number of queued records with '
+                        '--async_metrics')
+    parser.add_argument('--metric_backpressure', default='block',
+                        choices=BACKPRESSURE_POLICIES,
+                        help='what to do when the metric queue is full')
+    parser.add_argument('--progress_interval', default=10, type=float,
+                        help='with --config, seconds between two summaries '
+                        'of the progress bars of all running trials '
+                        '(0 disables them)')
+    parser.add_argument('--trace', action='store_true',
+                        help='time the phases of the run and any '
+                        'skeletor.timing.span blocks; writes trace.json and '
+                        'timing.txt into every trial directory and the '
+                        'experiment directory')
+    parser.add_argument('--profile', action='store_true',
+                        help='run every experiment_fn under a sampling '
+                        'profiler. Folded stacks go to profile.folded in '
+                        'the trial directory and are merged across trials '
+                        'into the experiment directory.')
+    parser.add_argument('--profile_interval', default=5, type=float,
+                        help='ms between two stack samples with --profile')
+
+
+@functools.lru_cache(maxsize=None)
+def _launcher_arg_names():
+    """ Names of every argument `_add_default_args` registers. """
+    parser = argparse.ArgumentParser()
+    _add_default_args(parser)
+    return frozenset(vars(parser.parse_args(['_'])))
+
+
+def _experiment(experiment_fn, args, metric_policies=None, listeners=()):
     """
     Launches the track experiment (+/- S3 backup) by calling
     `experiment_fn(args)` where args contains the parsed arguments.
+    `metric_policies` and `listeners` are passed on to the trial's
+    MetricLogger. With --trace, the trial's timing spans are written to
+    trace.json and timing.txt in its trial directory.
     """
-    # Set up the random seeds!
-    seed_all(args.seed)
+    tracer = Tracer() if args.trace else None
+    with tracing(tracer):
+        _traced_experiment(experiment_fn, args, metric_policies, listeners,
+                           tracer)
+
+
+def _traced_experiment(experiment_fn, args, metric_policies, listeners,
+                       tracer):
     # Set up track logging, locally + in S3
+    with span('import_track'):
+        import track
+        from track.constants import METADATA_FOLDER
     track_local_dir = os.path.join(args.logroot, args.experimentname)
+    # Skip or resume trials that already ran with this exact configuration.
+    trial_hash = param_hash(vars(args), _launcher_arg_names())
+    if args.resume:
+        state = trial_state(track_local_dir, trial_hash)
+        if state and state['completed']:
+            print('skipping completed trial {}'.format(trial_hash))
+            return
+        if state:
+            args.resume_from = state['trial_dirs'][-1]
+    # Set up the random seeds!
+    with span('seed_all'):
+        seed_all(args.seed)
+    # track.trial creates this without exist_ok, which races when several
+    # trials of a sweep start at once.
+    os.makedirs(os.path.join(track_local_dir, METADATA_FOLDER),
+                exist_ok=True)
     if args.s3:
         track_remote_dir = os.path.join(args.s3,
                                         args.projectname,
@@ -92,24 +208,164 @@ def _experiment(experiment_fn, args):
     else:
         track_remote_dir = None
     # Start the trial!
-    with track.trial(track_local_dir, track_remote_dir, param_map=vars(args)):
+    with track.trial(track_local_dir, track_remote_dir,
+                     param_map=vars(args)) as trial:
         track.debug("Starting experiment!")
-        experiment_fn(args)
+        mark_started(track_local_dir, trial_hash, trial.trial_dir())
+        # Trials of a sweep run side by side, so their progress bars go to
+        # a file that the driver summarizes instead of to stdout.
+        if args.config:
+            report_progress_to(os.path.join(trial.trial_dir(),
+                                            PROGRESS_FILE))
+        try:
+            if args.async_metrics or metric_policies or listeners:
+                logger = MetricLogger(args.metric_queue_size,
+                                      args.metric_backpressure,
+                                      policies=metric_policies,
+                                      asynchronous=args.async_metrics,
+                                      listeners=listeners)
+                logger.start()
+                try:
+                    _call_experiment_fn(experiment_fn, args,
+                                        trial.trial_dir())
+                finally:
+                    with span('metric_flush'):
+                        logger.close()
+            else:
+                _call_experiment_fn(experiment_fn, args, trial.trial_dir())
+            mark_completed(track_local_dir, trial_hash)
+        finally:
+            report_progress_to(None)
+            if tracer is not None:
+                tracer.save(trial.trial_dir())
+    # Index the trial as soon as track has closed it, so the finished
+    # trials of an interrupted sweep are indexed too.
+    with span('index'):
+        index_experiment(args.logroot, args.experimentname,
+                         [trial.trial_id])
+
+
+def _call_experiment_fn(experiment_fn, args, trial_dir):
+    """
+    Runs `experiment_fn(args)`. With --profile, it runs under a sampling
+    profiler whose folded stacks are saved to `trial_dir`.
+    """
+    with span('experiment_fn'):
+        if not args.profile:
+            experiment_fn(args)
+            return
+        profiler = SamplingProfiler(args.profile_interval / 1000)
+        try:
+            with profiler:
+                experiment_fn(args)
+        finally:
+            profiler.save(os.path.join(trial_dir, PROFILE_FILE))
+
+
+def _ensure_setup(setup_fn, args):
+    """ Runs the `supply_setup` hook unless this process already did. """
+    if setup_fn is not None and not _setup_done.val:
+        with span('setup'):
+            _setup_state.set(setup_fn(args))
+        _setup_done.set(True)
 
 
 def _compute_resources(args):
-    cpu = 1 if args.self_host and args.cpu else 0
+    """
+    Ray resources requested by each trial. GPU and CPU requests may be
+    fractional; with `trials_per_device` > 1 they are divided so that
+    that many trials share one device (or one cpu group with --cpu).
+    """
+    pack = max(args.trials_per_device, 1)
+    cpu = args.cpus_per_trial
+    if cpu is None:
+        cpu = 1 if args.self_host and args.cpu else 0
     gpu = 0 if args.cpu else min(args.devices_per_trial, args.self_host)
-    return {'cpu': cpu, 'gpu': gpu}
+    resources = {'cpu': cpu / pack, 'gpu': gpu / pack}
+    if args.memory_per_trial:
+        resources['memory'] = args.memory_per_trial * 1024 * 1024
+    return resources
 
 
-def _ray_experiment(experiment_fn, args, config, status_reporter):
+class _TuneForwarder:
+    """
+    Forwards every metric record of a trial to ray tune's status reporter
+    so that tune (and its scheduler) can follow the trial's progress.
+    Each report carries the latest value of every numeric metric logged so
+    far, since schedulers expect their metric in every result, and reports
+    the largest `iteration` logged so far as `timesteps_total`, so a
+    scheduler's `max_t` is in the trial's own iterations. If `required` is
+    set, nothing is reported until that metric was logged.
+    """
+    def __init__(self, status_reporter, required=None):
+        self.status_reporter = status_reporter
+        self.required = required
+        self.latest = {}
+        self.timesteps = 0
+
+    def __call__(self, record):
+        for k, v in record.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                self.latest[k] = v
+        iteration = record.get('iteration')
+        if isinstance(iteration, (int, float)):
+            # e.g. test records may log iteration=0 after training steps.
+            self.timesteps = max(self.timesteps, iteration)
+        if self.required and self.required not in self.latest:
+            return
+        self.status_reporter(**dict(self.latest,
+                                    timesteps_total=self.timesteps,
+                                    done=0))
+
+    def finish(self):
+        """ Marks the trial as done. """
+        self.status_reporter(**dict(self.latest,
+                                    timesteps_total=self.timesteps,
+                                    done=1))
+
+
+def _ray_experiment(experiment_fn, args, metric_policies, scheduler_metric,
+                    setup_fn, config, status_reporter):
     """ This is the actor that will start the track trial """
+    _ensure_setup(setup_fn, args)
+    config = config.get(_TRIAL_KEY, config)
     for k, v in config.items():
         setattr(args, k, v)
     status_reporter(timesteps_total=0, done=0)
-    _experiment(experiment_fn, args)
-    status_reporter(timesteps_total=1, done=1)
+    forwarder = _TuneForwarder(status_reporter, scheduler_metric)
+    _experiment(experiment_fn, args, metric_policies, [forwarder])
+    forwarder.finish()
+
+
+# Key under which tune hands each trial its config from skeletor.config.
+_TRIAL_KEY = 'skeletor_trial'
+
+
+# Tune schedulers that can be picked by `type` in the config's
+# `skeletor: {scheduler: ...}` block.
+_SCHEDULERS = {
+    'fifo': 'FIFOScheduler',
+    'asha': 'AsyncHyperBandScheduler',
+    'async_hyperband': 'AsyncHyperBandScheduler',
+    'hyperband': 'HyperBandScheduler',
+    'median_stopping': 'MedianStoppingRule',
+}
+
+
+def _build_scheduler(spec):
+    """
+    Builds a tune trial scheduler from a dict like
+    {'type': 'asha', 'reward_attr': 'avg_test_acc', 'max_t': 100}.
+    All keys but `type` go to the scheduler's constructor, so use the
+    argument names of the installed ray version.
+    """
+    import ray.tune.schedulers
+    spec = dict(spec)
+    kind = spec.pop('type', 'fifo')
+    if kind not in _SCHEDULERS:
+        raise SkeletorException('unknown tune scheduler {!r}, choose from '
+                                '{}'.format(kind, sorted(_SCHEDULERS)))
+    return getattr(ray.tune.schedulers, _SCHEDULERS[kind])(**spec)
 
 
 def _launch_ray_experiments(experiment_fn, args):
@@ -118,17 +374,41 @@ def _launch_ray_experiments(experiment_fn, args):
     Allocate resources per experiment.
     Schedule all the trials and start them all.
     """
-    if args.cpu:
-        ray.init(num_cpus=args.self_host, num_gpus=0)
-    else:
-        ray.init(num_gpus=args.self_host)
+    with span('import_ray'):
+        import ray
+        import ray.tune
+        from ray.tune import register_trainable, run_experiments
+    # Ray runs each trial in its own working directory. Resolve the logroot
+    # now so trials write straight into its final location.
+    args.logroot = os.path.abspath(args.logroot)
+    with span('ray_init'):
+        if args.cpu:
+            ray.init(num_cpus=args.self_host, num_gpus=0)
+        else:
+            ray.init(num_gpus=args.self_host)
+
+    with span('expand_config'):
+        config, options = load_config(args.config, args.seed)
+        # Tune gets the trials already expanded by skeletor.config, so that
+        # skeletor's samplers work the same under every backend.
+        config = {_TRIAL_KEY: {'grid_search': list(generate_trials(
+            config, options))}}
+    scheduler_spec = options.get('scheduler') or {}
+    scheduler = _build_scheduler(scheduler_spec) if scheduler_spec else None
+    scheduler_metric = (scheduler_spec.get('reward_attr') or
+                        scheduler_spec.get('metric'))
+
+    # Trials run in other processes, so hand them the policies and the
+    # setup hook explicitly.
+    metric_policies = _metric_policies.val
+    setup_fn = _setup_fn.val
 
     def _real_ray_exp(config, status_reporter):
-        _ray_experiment(experiment_fn, args, config, status_reporter)
-    register_trainable('ray_experiment', _real_ray_exp)
-
-    with open(args.config) as f:
-        config = yaml.load(f)
+        _ray_experiment(experiment_fn, args, metric_policies,
+                        scheduler_metric, setup_fn, config, status_reporter)
+    # This pickles the experiment closure.
+    with span('register_trainable'):
+        register_trainable('ray_experiment', _real_ray_exp)
 
     resources = _compute_resources(args)
     experiment_setting = {
@@ -143,48 +423,194 @@ def _launch_ray_experiments(experiment_fn, args):
         }
     }
 
+    run_kwargs = {}
+    # Only ray versions that can reuse trial actors accept this.
+    if (args.warm_workers and
+            'reuse_actors' in inspect.signature(run_experiments).parameters):
+        run_kwargs['reuse_actors'] = True
     try:
-        run_experiments(experiment_setting,
-                        server_port=int(args.server_port),
-                        with_server=True)
+        with span('run_experiments'):
+            run_experiments(experiment_setting,
+                            scheduler=scheduler,
+                            server_port=int(args.server_port),
+                            with_server=True,
+                            **run_kwargs)
     except ray.tune.error.TuneError as e:
         print('swalling tune error: {}'.format(e))
 
 
+def _move_file(src, dst):
+    """
+    Moves one file, by rename when src and dst share a filesystem and by
+    copying otherwise. A copy goes to `<dst>.partial` first and the source
+    is only deleted once the copy is in place, so an interrupted move can
+    simply be retried.
+    """
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    partial = dst + '.partial'
+    shutil.copy2(src, partial)
+    os.replace(partial, dst)
+    os.remove(src)
+
+
+def _plan_moves(src_dir, dst_dir, moves):
+    """
+    Moves whole directories of `src_dir` into `dst_dir` by rename where
+    possible and appends the (src, dst) file moves that are left to
+    `moves`. Existing destination directories are merged into.
+    """
+    for name in os.listdir(src_dir):
+        src = os.path.join(src_dir, name)
+        dst = os.path.join(dst_dir, name)
+        if not os.path.isdir(src):
+            moves.append((src, dst))
+            continue
+        if not os.path.exists(dst):
+            try:
+                os.rename(src, dst)
+                continue
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+            os.makedirs(dst)
+        _plan_moves(src, dst, moves)
+
+
+def _collate(src_dir, dst_dir, workers=8):
+    """
+    Moves the contents of `src_dir` into `dst_dir`, copying files in
+    parallel when a rename is not possible, and prints progress.
+    """
+    moves = []
+    _plan_moves(src_dir, dst_dir, moves)
+    every = max(1, len(moves) // 10)
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        futures = [pool.submit(_move_file, src, dst) for src, dst in moves]
+        for i, future in enumerate(
+                concurrent.futures.as_completed(futures), 1):
+            future.result()
+            if i % every == 0 or i == len(moves):
+                print('collated {}/{} files into {}'.format(
+                    i, len(moves), dst_dir))
+
+
+# The slot of a local backend worker, set by `_init_local_worker`.
+_local_slot = LaunchVar()
+
+
+def _init_local_worker(slots, setup_fn, args):
+    """
+    Takes a free slot for the lifetime of this worker and pins to it before
+    running the setup hook, so setup already sees the worker's gpu. The
+    slot is handed back when the worker exits.
+    """
+    slot = slots.get()
+    _local_slot.set(slot)
+    # Runs before multiprocessing joins the queue's feeder thread on exit.
+    multiprocessing.util.Finalize(None, slots.put, args=(slot,),
+                                  exitpriority=0)
+    _pin_to_slot(slot, args)
+    _ensure_setup(setup_fn, args)
+
+
+def _pin_to_slot(slot, args):
+    """
+    Restricts this worker to its share of the cpus (and gpus) so trials
+    running side by side do not contend for the same cores.
+    """
+    if hasattr(os, 'sched_setaffinity'):
+        cores = sorted(os.sched_getaffinity(0))
+        # Fractional --cpus_per_trial still needs a whole core to pin to.
+        per_trial = max(1, math.ceil(args.cpus_per_trial or
+                                     len(cores) // max(args.self_host, 1)))
+        group = cores[slot * per_trial:(slot + 1) * per_trial]
+        # Without enough cores for this slot's group, leave it unpinned.
+        if len(group) == per_trial:
+            os.sched_setaffinity(0, group)
+    if not args.cpu:
+        devices = os.environ.get('CUDA_VISIBLE_DEVICES')
+        devices = (devices.split(',') if devices else
+                   [str(i) for i in range(max(args.self_host, 1))])
+        os.environ['CUDA_VISIBLE_DEVICES'] = devices[slot % len(devices)]
+
+
+def _local_experiment(experiment_fn, args, metric_policies, config):
+    """
+    Runs one trial of a local sweep in a pool worker. Returns None, or the
+    formatted traceback if the trial failed.
+    """
+    try:
+        for k, v in config.items():
+            setattr(args, k, v)
+        _experiment(experiment_fn, args, metric_policies)
+        return None
+    except Exception:  # pylint: disable=broad-except
+        return traceback.format_exc()
+
+
+def _launch_local_experiments(experiment_fn, args):
+    """
+    Runs every trial of the config sweep in a pool of `args.self_host`
+    worker processes, each pinned to its own set of cpus, without ray.
+    Trials write straight into `<args.logroot>/<args.experimentname>`.
+
+    Every trial runs in a fresh process, unless `args.warm_workers` is set:
+    then workers are long-lived, run the `supply_setup` hook once, and go
+    through many trials back to back (still re-seeded and in a fresh
+    track.trial each time).
+    """
+    args.logroot = os.path.abspath(args.logroot)
+    config, options = load_config(args.config, args.seed)
+    # Forked workers inherit what the driver imported, so import track once
+    # here rather than once per worker.
+    with span('import_track'):
+        import track  # pylint: disable=unused-import
+    workers = max(args.self_host, 1)
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    slots = ctx.Queue()
+    for slot in range(workers):
+        slots.put(slot)
+    run_trial = functools.partial(_local_experiment, experiment_fn, args,
+                                  _metric_policies.val)
+    with ctx.Pool(workers, initializer=_init_local_worker,
+                  initargs=(slots, _setup_fn.val, args),
+                  maxtasksperchild=None if args.warm_workers else 1) as pool:
+        for error in pool.imap_unordered(run_trial,
+                                         generate_trials(config, options)):
+            if error:
+                print('trial failed:\n{}'.format(error))
+
+
 def _cleanup_ray_experiments(args):
     """
-    Takes the ray results from ./raydata and moves them into
+    Takes any ray results left in ./raydata and moves them into
     `<args.logroot>/<args.experimentname>` for permanent storage.
+
+    Trials launched by `_launch_ray_experiments` write straight into the
+    logroot, so this only has work to do for runs from older versions
+    (or with a logroot that was relative to ray's trial directory).
+    It is safe to rerun after an interruption.
     """
     track_local_dir = os.path.join(args.logroot, args.experimentname)
     os.makedirs(track_local_dir, exist_ok=True)
-    os.makedirs('raydata', exist_ok=True)  # just in case we did nothing
-    for experiment in os.listdir('raydata'):
-        if experiment != args.experimentname:
-            continue
-        experiment_dir = os.path.join('raydata', experiment)
-        for runname in os.listdir(experiment_dir):
-            rundir = os.path.join(experiment_dir, runname,
-                                  'logs',
-                                  args.experimentname)
-            for f in os.listdir(rundir):
-                cur = os.path.join(rundir, f)
-                new_dst = os.path.join(track_local_dir, f)
-                if f != 'trials':
-                    shutil.move(cur, new_dst)
-                    continue
-                if os.path.isdir(new_dst):
-                    ray_trial_dir = os.path.join(rundir, f)
-                    for trial_data in os.listdir(ray_trial_dir):
-                        ray_trial_data = os.path.join(ray_trial_dir,
-                                                      trial_data)
-                        new_trial_data = os.path.join(new_dst, trial_data)
-                        shutil.move(ray_trial_data, new_trial_data)
-                else:
-                    shutil.move(cur, new_dst)
-
-
-def supply_args(argument_fn=None):
+    experiment_dir = os.path.join('raydata', args.experimentname)
+    if not os.path.isdir(experiment_dir):
+        return
+    for runname in os.listdir(experiment_dir):
+        rundir = os.path.join(experiment_dir, runname,
+                              'logs',
+                              args.experimentname)
+        if os.path.isdir(rundir):
+            _collate(rundir, track_local_dir)
+
+
+def supply_args(argument_fn=None, metric_policies=None):
     """
     ** This function must be called before `execute` **
 
@@ -194,7 +620,13 @@ def supply_args(argument_fn=None):
     Please see `_add_default_args` for defaults on these additions.
 
     `argument_fn(parser)`: adds user-specific arguments to the argparser.
+
+    `metric_policies`: optional dict from metric name to a decimation
+    policy from `skeletor.metric_logger` (`Every`, `Window`,
+    `OnImprovement`), e.g. {'cur_train_loss': Every(10)}. Policies are
+    applied to every `track.metric` call before the record reaches track.
     """
+    _metric_policies.set(metric_policies)
     _parser.set(argparse.ArgumentParser(description='skeletor arg parser'))
     _add_default_args(_parser.val)
     if argument_fn:
@@ -213,31 +645,145 @@ def supply_postprocess(postprocess_fn=None, save_proj=False):
     Postprocessing will be called after `_experiment` or after
     `_cleanup_ray_experiments` depending on if ray was used or not.
 
-    `save_proj`: if True, this will create a pickle file containing the
-    track.Project object generated for `args.experimentname`.
-    It will save to <logroot>/<experimentname>/<experimentname>.pkl
+    `save_proj`: if True, this will write a columnar snapshot (trials and
+    metrics tables as Feather files) of the track.Project generated for
+    `args.experimentname`. It will save to
+    <logroot>/<experimentname>/<experimentname>.snapshot
+    and can be opened memory-mapped with `skeletor.proc.load_snapshot`.
+    Snapshots need pyarrow (`pip install skeletor-ml[arrow]`), which is
+    checked here rather than after all trials have run.
     """
+    if save_proj and importlib.util.find_spec('pyarrow') is None:
+        raise SkeletorException('save_proj=True requires pyarrow; install '
+                                'it with `pip install skeletor-ml[arrow]`')
     _postprocess_fn.set(postprocess_fn)
     _save_proj.set(save_proj)
 
 
+def _dry_run(args):
+    """ Prints the size of the sweep in `args.config` and a preview. """
+    config, options = load_config(args.config, args.seed)
+    print('{} trials in {}'.format(count_trials(config, options),
+                                   args.config))
+    for trial in preview(config, options):
+        print('  {}'.format(trial))
+
+
+def supply_setup(setup_fn=None):
+    """
+    ** This function must be called before `execute` **
+
+    Registers `setup_fn(args)`, run once per process before its first
+    trial, e.g. to import heavy modules or build datasets from
+    `args.dataroot`. Its return value is available to `experiment_fn`
+    through `skeletor.setup_state()`. With --warm_workers, one setup serves
+    every trial a worker runs, so it should only depend on arguments that
+    are the same for all trials.
+    """
+    _setup_fn.set(setup_fn)
+
+
+def setup_state():
+    """ Returns what the `supply_setup` hook returned in this process. """
+    return _setup_state.val
+
+
 def execute(experiment_fn):
     """
     Launches an experiment using the supplied `experiment_fn(args)` launcher.
-    If the config is set, it will use ray to launch all experiments
+    If the config is set, it will use ray (or, with --backend=local or
+    without ray installed, a local process pool) to launch all experiments
     in parallel.
     """
+    start = time.perf_counter()
     # Parse all arguments (default + user-supplied)
     if not _parser.val:
         supply_args()
     args = _parser.val.parse_args()
-    # Launch ray if we need to.
-    if args.config:
-        _launch_ray_experiments(experiment_fn, args)
-        _cleanup_ray_experiments(args)
+    if args.config and args.dry_run:
+        _dry_run(args)
+        return
+    tracer = Tracer() if args.trace else None
+    if tracer is not None:
+        tracer.add('parse_args', start, time.perf_counter())
+    with tracing(tracer):
+        _execute(experiment_fn, args)
+    if tracer is not None:
+        _save_trace(tracer, args)
+
+
+def _save_trace(tracer, args):
+    """
+    Writes the driver's trace, merged with the traces of the trials it
+    ran, into the experiment directory and prints the driver's summary.
+    """
+    exp_dir = os.path.join(args.logroot, args.experimentname)
+    events = []
+    for name in sorted(os.listdir(exp_dir)):
+        path = os.path.join(exp_dir, name, TRACE_FILE)
+        # Skip the traces of trials from earlier runs.
+        if os.path.isfile(path) and \
+                os.stat(path).st_mtime >= tracer.wall_start:
+            events.extend(read_trace(path))
+    tracer.save(exp_dir, events)
+    print(tracer.format_summary())
+
+
+def _merge_profiles(args, since):
+    """
+    Merges the profiles of the trials that ran since `since` and prints
+    where most time was spent.
+    """
+    exp_dir = os.path.join(args.logroot, args.experimentname)
+    counts = merge_profiles(exp_dir, since)
+    total = sum(counts.values())
+    if not total:
+        return
+    print('{} profile samples merged into {}'.format(
+        total, os.path.join(exp_dir, PROFILE_FILE)))
+    for label, samples in top_functions(counts, 10):
+        print('{:6.1%}  {}'.format(samples / total, label))
+
+
+@contextlib.contextmanager
+def _monitor_progress(args):
+    """ Prints a summary of the progress of all running trials every
+    --progress_interval seconds while active. """
+    if args.progress_interval <= 0:
+        yield
+        return
+    exp_dir = os.path.join(os.path.abspath(args.logroot), args.experimentname)
+    with ProgressMonitor(exp_dir, args.progress_interval):
+        yield
+
+
+def _execute(experiment_fn, args):
+    started = time.time()
+    # Launch ray (or the local process pool) if we need to. Config sweeps
+    # fall back to the local process pool if ray is not installed.
+    if args.config and (args.backend == 'local' or
+                        importlib.util.find_spec('ray') is None):
+        with span('run_trials'), _monitor_progress(args):
+            _launch_local_experiments(experiment_fn, args)
+    elif args.config:
+        with span('run_trials'), _monitor_progress(args):
+            _launch_ray_experiments(experiment_fn, args)
+        with span('cleanup'):
+            _cleanup_ray_experiments(args)
     # Launch a single experiment otherwise.
     else:
-        _experiment(experiment_fn, args)
+        with span('run_trials'):
+            _ensure_setup(_setup_fn.val, args)
+            _experiment(experiment_fn, args, _metric_policies.val)
+    if args.profile:
+        with span('merge_profiles'):
+            _merge_profiles(args, started)
+    with span('import_track'):
+        import track
+    # Trials index themselves when they finish; this catches any that
+    # did not, e.g. because they failed.
+    with span('index'):
+        index_experiment(args.logroot, args.experimentname)
     # Load resulting experiment data from Track
     local = os.path.join(args.logroot, args.experimentname)
     if args.s3:
@@ -246,16 +792,14 @@ def execute(experiment_fn):
                                         args.experimentname)
     else:
         track_remote_dir = None
-    proj = track.Project(local, track_remote_dir)
-    # Save project to a pickle in <logroot>/<experimentname>.
+    with span('load_project'):
+        proj = track.Project(local, track_remote_dir)
+    # Save a columnar snapshot of the project in <logroot>/<experimentname>.
     if _save_proj.val:
-        proj_fname = os.path.join(args.logroot, args.experimentname,
-                                  args.experimentname + '.pkl')
-        try:
-            with open(proj_fname, 'wb') as f:
-                pickle.dump(proj, f)
-        except SkeletorException as e:
-            print('swallowing pickle error: {}'.format(e))
+        with span('snapshot'):
+            save_snapshot(proj, snapshot_dir(args.experimentname,
+                                             args.logroot))
     # Launch postprocessing code.
     if _postprocess_fn.val:
-        _postprocess_fn.val(proj)
+        with span('postprocess'):
+            _postprocess_fn.val(proj)
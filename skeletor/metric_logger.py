@@ -0,0 +1,283 @@
+"""
+An asynchronous, batched front-end for `track.metric`.
+
+While installed, `track.metric(...)` only appends the record to an
+in-memory queue. A background thread drains the queue in batches and hands
+each record to the real `track.metric`, so the on-disk records are exactly
+the ones a synchronous call would have written.
+
+Per-metric decimation policies (`Every`, `Window`, `OnImprovement`) can
+thin out or aggregate values before they are queued.
+"""
+import collections
+import copy
+import os
+import signal
+import threading
+
+BACKPRESSURE_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+# Keys that index a record rather than measure something.
+_INDEX_KEYS = ('epoch',)
+
+
+class Every:
+    """ Keeps every `n`-th value of a metric, starting with the first. """
+    def __init__(self, n):
+        self.n = n
+        self._seen = collections.Counter()
+
+    def __call__(self, name, value):
+        self._seen[name] += 1
+        if (self._seen[name] - 1) % self.n:
+            return {}
+        return {name: value}
+
+
+class Window:
+    """
+    Aggregates every `k` values of a metric into `<name>_<stat>` entries,
+    one per stat in `stats` ('mean', 'min' or 'max'). A partial window left
+    at the end of a trial is aggregated by `flush`.
+    """
+    _STATS = {'mean': lambda vs: sum(vs) / len(vs), 'min': min, 'max': max}
+
+    def __init__(self, k, stats=('mean', 'min', 'max')):
+        assert all(stat in self._STATS for stat in stats), \
+            'stats must be among {}'.format(tuple(self._STATS))
+        self.k = k
+        self.stats = stats
+        self._values = collections.defaultdict(list)
+
+    def __call__(self, name, value):
+        values = self._values[name]
+        values.append(value)
+        if len(values) < self.k:
+            return {}
+        del self._values[name]
+        return self._aggregate(name, values)
+
+    def _aggregate(self, name, values):
+        return {'{}_{}'.format(name, stat): self._STATS[stat](values)
+                for stat in self.stats}
+
+    def flush(self):
+        """ Aggregates the values of every partial window. """
+        out = {}
+        for name, values in self._values.items():
+            out.update(self._aggregate(name, values))
+        self._values.clear()
+        return out
+
+
+class OnImprovement:
+    """ Keeps a value only if it beats every earlier value of the metric. """
+    def __init__(self, mode='max'):
+        assert mode in ('max', 'min'), "mode must be 'max' or 'min'"
+        self.mode = mode
+        self._best = {}
+
+    def __call__(self, name, value):
+        best = self._best.get(name)
+        if best is not None and (value <= best if self.mode == 'max'
+                                 else value >= best):
+            return {}
+        self._best[name] = value
+        return {name: value}
+
+
+class MetricLogger:  # pylint: disable=too-many-instance-attributes
+    """
+    Queues `track.metric` records and writes them from a background thread.
+
+    `queue_size`: maximum number of records waiting to be written.
+    `backpressure`: what `log` does when the queue is full. 'block' waits
+        for the writer to catch up, 'drop_oldest' discards the oldest queued
+        record and 'drop_newest' discards the record being logged.
+    `batch_size`: the writer is woken up once this many records are queued.
+    `flush_interval`: seconds after which a partial batch is written anyway.
+    `policies`: dict mapping metric names to decimation policies. Each
+        policy sees every logged value of its metric and decides what, if
+        anything, is written. A record whose metrics are all withheld is
+        not written at all. Policies with a `flush` method are flushed
+        on `close` and what they return is written as a last record.
+    `asynchronous`: if False, records are written on the calling thread
+        and only the policies apply.
+    `listeners`: callables that get every record (after the policies) as
+        a dict, on the calling thread, e.g. to forward it to ray tune.
+    """
+    def __init__(self, queue_size=10000, backpressure='block',
+                 batch_size=256, flush_interval=1.0, policies=None,
+                 asynchronous=True, listeners=()):
+        assert backpressure in BACKPRESSURE_POLICIES, \
+            'backpressure must be one of {}'.format(BACKPRESSURE_POLICIES)
+        self.queue_size = queue_size
+        self.backpressure = backpressure
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Policies are stateful, so every logger gets its own copy.
+        self.policies = copy.deepcopy(policies or {})
+        self.asynchronous = asynchronous
+        self.listeners = list(listeners)
+        self.dropped = 0
+        self._write = None
+        self._last_iteration = None
+        self._queue = collections.deque()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._closing = False
+        self._flushing = False
+        self._error = None
+        self._thread = None
+        self._old_handlers = {}
+
+    def _decimate(self, kwargs):
+        """ Applies the policies; returns None if nothing is left to log. """
+        out = {}
+        measured = False
+        for name, value in kwargs.items():
+            policy = self.policies.get(name)
+            if policy is None:
+                out[name] = value
+                measured = measured or name not in _INDEX_KEYS
+            else:
+                kept = policy(name, value)
+                out.update(kept)
+                measured = measured or bool(kept)
+        return out if measured else None
+
+    def log(self, *, iteration=None, **kwargs):
+        """ Drop-in replacement for `track.metric`. """
+        self._last_iteration = iteration
+        if self.policies:
+            kwargs = self._decimate(kwargs)
+            if kwargs is None:
+                return
+        self._emit(iteration, kwargs)
+
+    def _emit(self, iteration, kwargs):
+        for listener in self.listeners:
+            listener(dict(kwargs, iteration=iteration))
+        if not self.asynchronous:
+            self._write(iteration=iteration, **kwargs)
+            return
+        kwargs['iteration'] = iteration
+        with self._cond:
+            if self._error:
+                raise self._error
+            if len(self._queue) >= self.queue_size:
+                if self.backpressure == 'drop_newest':
+                    self.dropped += 1
+                    return
+                if self.backpressure == 'drop_oldest':
+                    self._queue.popleft()
+                    self._pending -= 1
+                    self.dropped += 1
+                else:
+                    self._cond.wait_for(
+                        lambda: (len(self._queue) < self.queue_size or
+                                 self._error))
+                    if self._error:
+                        raise self._error
+            self._queue.append(kwargs)
+            self._pending += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self):
+        """ Blocks until every queued record has been written. """
+        if not self.asynchronous:
+            return
+        with self._cond:
+            self._flushing = True
+            self._cond.notify_all()
+            self._cond.wait_for(lambda: not self._pending or self._error)
+            self._flushing = False
+            if self._error:
+                raise self._error
+
+    def _ready(self):
+        return (len(self._queue) >= self.batch_size or self._flushing or
+                self._closing)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(self._ready, timeout=self.flush_interval)
+                batch, self._queue = self._queue, collections.deque()
+                closing = self._closing
+                self._cond.notify_all()
+            try:
+                for kwargs in batch:
+                    self._write(**kwargs)
+            except Exception as e:  # pylint: disable=broad-except
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._pending -= len(batch)
+                self._cond.notify_all()
+            if closing and not batch:
+                return
+
+    def _on_signal(self, signum, frame):
+        self.flush()
+        handler = self._old_handlers.get(signum)
+        if callable(handler):
+            handler(signum, frame)
+        elif handler == signal.SIG_DFL:
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    def start(self):
+        """ Routes `track.metric` through this logger. """
+        import track
+        self._write = track.metric
+        track.metric = self.log
+        if not self.asynchronous:
+            return
+        self._thread = threading.Thread(target=self._run,
+                                        name='skeletor-metric-logger',
+                                        daemon=True)
+        self._thread.start()
+        # Signal handlers can only be installed from the main thread, which
+        # is not where trials run under ray.
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                self._old_handlers[signum] = signal.signal(signum,
+                                                           self._on_signal)
+
+    def _flush_policies(self):
+        out = {}
+        for policy in self.policies.values():
+            if callable(getattr(policy, 'flush', None)):
+                out.update(policy.flush())
+        if out:
+            self._emit(self._last_iteration, out)
+
+    def close(self):
+        """
+        Writes what the policies still hold and everything still queued,
+        then restores `track.metric`.
+        """
+        import track
+        for signum, handler in self._old_handlers.items():
+            signal.signal(signum, handler)
+        self._old_handlers = {}
+        if self._error is None:
+            self._flush_policies()
+        if self.asynchronous:
+            with self._cond:
+                self._closing = True
+                self._cond.notify_all()
+            self._thread.join()
+        track.metric = self._write
+        if self._error:
+            raise self._error
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
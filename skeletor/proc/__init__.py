@@ -1,2 +1,5 @@
 """ This module contains all postprocessing utilities to work w/track """
 from .track_analysis import proj, df_from_proj
+from .downsample import every, per_epoch, lttb
+from .index import build_index, index_experiment, top_trials
+from .snapshot import save_snapshot, load_snapshot, Snapshot
@@ -0,0 +1,88 @@
+"""
+Persistent on-disk cache of an experiment's track results.
+
+The cache lives in `<proj_dir>/.skeletor_cache` as a Feather file holding the
+raw result rows of every trial plus a JSON manifest mapping each trial id to
+the mtime and size of its result file. On load, only trials whose result
+file is new or changed since the last load are re-parsed.
+"""
+import json
+import os
+
+import numpy as np
+
+from skeletor.proc.records import result_file, read_results
+
+CACHE_DIR = '.skeletor_cache'
+_FRAME = 'results.feather'
+_MANIFEST = 'manifest.json'
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _load(cache_dir):
+    """ Returns the cached (manifest, frame), or empty ones if unusable. """
+    import pandas as pd
+    frame_file = os.path.join(cache_dir, _FRAME)
+    manifest_file = os.path.join(cache_dir, _MANIFEST)
+    if not (os.path.isfile(frame_file) and os.path.isfile(manifest_file)):
+        return {}, None
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+        return manifest, pd.read_feather(frame_file)
+    except (OSError, ValueError) as e:
+        print('ignoring unreadable results cache: {}'.format(e))
+        return {}, None
+
+
+def _store(cache_dir, manifest, frame):
+    """ Atomically replaces the cached frame, then its manifest. """
+    os.makedirs(cache_dir, exist_ok=True)
+    frame_file = os.path.join(cache_dir, _FRAME)
+    manifest_file = os.path.join(cache_dir, _MANIFEST)
+    try:
+        frame.to_feather(frame_file + '.tmp')
+    except (ImportError, TypeError, ValueError) as e:
+        # e.g. pyarrow is missing or a metric mixes strings and numbers.
+        print('not caching results: {}'.format(e))
+        return
+    os.replace(frame_file + '.tmp', frame_file)
+    with open(manifest_file + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(manifest_file + '.tmp', manifest_file)
+
+
+def cached_results(log_dir, trial_ids, workers=1):
+    """
+    Returns the raw result frame for `trial_ids` (in that trial order),
+    re-reading only the trials whose result files changed since the cache
+    in `<log_dir>/.skeletor_cache` was written, and updating the cache.
+    `workers` is passed on to read_results for the re-read trials.
+    """
+    import pandas as pd
+    cache_dir = os.path.join(log_dir, CACHE_DIR)
+    manifest, cached = _load(cache_dir)
+    current = {trial_id: _stat_key(result_file(log_dir, trial_id))
+               for trial_id in trial_ids}
+    cached_ids = set()
+    if cached is not None:
+        cached_ids = set(cached['trial_id'].unique())
+    fresh = {trial_id for trial_id, key in current.items()
+             if manifest.get(trial_id) == key and trial_id in cached_ids}
+    stale = [trial_id for trial_id in trial_ids if trial_id not in fresh]
+    if not stale and set(manifest) == fresh:
+        frame = cached
+    else:
+        frames = [read_results(log_dir, stale, workers)] if stale else []
+        if fresh:
+            frames.insert(0, cached[cached['trial_id'].isin(fresh)])
+        frame = pd.concat(frames, axis=0, ignore_index=True, sort=False)
+        _store(cache_dir, current, frame)
+    # Restore the trial order the caller asked for.
+    order = pd.Categorical(frame['trial_id'], categories=trial_ids).codes
+    frame = frame.iloc[np.argsort(order, kind='stable')]
+    return frame.reset_index(drop=True)
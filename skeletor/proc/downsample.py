@@ -0,0 +1,116 @@
+"""
+Downsampling policies applied to each trial's records as they are read.
+
+Every policy is a picklable callable mapping one trial's result frame to a
+smaller one, so it can also run inside the worker processes used by
+`df_from_proj(workers=N)`. Build them with `every`, `per_epoch` or `lttb`.
+"""
+import functools
+
+import numpy as np
+
+from skeletor.error import SkeletorException
+
+
+def _every(df, n, x):
+    if x not in df.columns:
+        return df.iloc[::n]
+    keep = df[x].isna() | (df[x] % n == 0)
+    return df[keep.values]
+
+
+def every(n, x='iteration'):
+    """
+    Keeps rows whose `x` is a multiple of `n`, plus rows that have no `x`.
+    Records logged at iteration 0 (e.g. per-epoch test metrics in
+    examples/train.py) are therefore always kept.
+    """
+    return functools.partial(_every, n=n, x=x)
+
+
+def _per_epoch(df, agg, epoch):
+    if epoch not in df.columns:
+        return df
+    numeric = df.select_dtypes(include=['number', 'bool']).columns
+    aggs = {c: agg for c in numeric if c != epoch}
+    if 'iteration' in aggs:
+        aggs['iteration'] = 'max'
+    for c in df.columns:
+        if c not in aggs and c != epoch:
+            aggs[c] = 'first'
+    return df.groupby(epoch, sort=True).agg(aggs).reset_index()
+
+
+def per_epoch(agg='mean', epoch='epoch'):
+    """
+    Collapses each trial to one row per epoch, aggregating numeric metrics
+    with `agg` (any pandas aggregation name) and keeping the last iteration.
+    """
+    return functools.partial(_per_epoch, agg=agg, epoch=epoch)
+
+
+def _lttb_indices(x, y, n_points):
+    """ Largest-Triangle-Three-Buckets: positions of the points to keep. """
+    size = len(x)
+    if n_points >= size or n_points < 3:
+        return np.arange(size)
+    edges = np.linspace(1, size - 1, n_points - 1).astype(int)
+    keep = [0]
+    a = 0
+    for i in range(n_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo = edges[i + 1]
+        nhi = edges[i + 2] if i + 2 < len(edges) else size
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) -
+                      (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep.append(a)
+    keep.append(size - 1)
+    return np.asarray(keep)
+
+
+def _lttb(df, n_points, y, x):
+    if y not in df.columns:
+        return df.iloc[:0]
+    curve = df[df[y].notna().values]
+    if x in curve.columns:
+        curve = curve.sort_values(x, kind='stable')
+        xs = curve[x].values.astype(float)
+    else:
+        xs = np.arange(len(curve), dtype=float)
+    idx = _lttb_indices(xs, curve[y].values.astype(float), n_points)
+    return curve.iloc[idx]
+
+
+def lttb(n_points, y, x='iteration'):
+    """
+    Keeps at most `n_points` rows per trial chosen by
+    Largest-Triangle-Three-Buckets on the curve `y` over `x`, which
+    preserves the visual shape of the curve. Rows without `y` are dropped.
+    """
+    return functools.partial(_lttb, n_points=n_points, y=y, x=x)
+
+
+def as_policy(spec):
+    """
+    Normalizes a downsampling spec: an int N means `every(N)`, the string
+    'epoch' means `per_epoch()`, and callables are used as they are.
+    """
+    if spec is None or callable(spec):
+        return spec
+    if isinstance(spec, int):
+        return every(spec)
+    if spec == 'epoch':
+        return per_epoch()
+    raise SkeletorException('unknown downsampling spec: {!r}'.format(spec))
+
+
+def apply_per_trial(frame, policy):
+    """ Applies `policy` to each trial of an already loaded frame. """
+    import pandas as pd
+    if policy is None or frame.empty:
+        return frame
+    parts = [policy(group) for _, group in
+             frame.groupby('trial_id', sort=False, observed=True)]
+    return pd.concat(parts, axis=0, ignore_index=True, sort=False)
@@ -0,0 +1,199 @@
+"""
+A small SQLite index of every trial under a logroot.
+
+For each trial it records the experiment name, the trial params, the wall
+time and, for every numeric metric, the final, minimum and maximum value.
+That is enough to rank trials across all experiments without touching the
+raw track records. `execute` keeps the index of its logroot up to date;
+`build_index` creates it from existing experiment directories.
+"""
+import datetime
+import json
+import os
+import sqlite3
+
+from skeletor.proc.records import result_file, read_results, KEY_COLUMNS
+
+INDEX_NAME = 'skeletor_index.sqlite'
+# Bumped whenever _SCHEMA changes; older indexes are dropped and rebuilt.
+_SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    experiment TEXT, trial_id TEXT, params TEXT, wall_time REAL,
+    result_mtime INTEGER, result_size INTEGER,
+    params_mtime INTEGER, params_size INTEGER,
+    PRIMARY KEY (experiment, trial_id));
+CREATE TABLE IF NOT EXISTS params (
+    experiment TEXT, trial_id TEXT, name TEXT, value,
+    PRIMARY KEY (experiment, trial_id, name));
+CREATE TABLE IF NOT EXISTS metrics (
+    experiment TEXT, trial_id TEXT, name TEXT,
+    final REAL, min REAL, max REAL,
+    PRIMARY KEY (experiment, trial_id, name));
+CREATE INDEX IF NOT EXISTS params_by_name ON params (name, value);
+CREATE INDEX IF NOT EXISTS metrics_by_name ON metrics (name);
+"""
+
+
+def _connect(logroot):
+    conn = sqlite3.connect(os.path.join(logroot, INDEX_NAME), timeout=60)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version != _SCHEMA_VERSION:
+        conn.executescript('DROP TABLE IF EXISTS trials; '
+                           'DROP TABLE IF EXISTS params; '
+                           'DROP TABLE IF EXISTS metrics; '
+                           'PRAGMA user_version = {};'.format(
+                               _SCHEMA_VERSION))
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _parse_time(value):
+    """ Parses datetime.isoformat() output, which omits zero microseconds
+    (datetime.fromisoformat needs Python 3.7). """
+    fmt = '%Y-%m-%dT%H:%M:%S.%f' if '.' in value else '%Y-%m-%dT%H:%M:%S'
+    return datetime.datetime.strptime(value, fmt)
+
+
+def _wall_time(param_map):
+    try:
+        start = _parse_time(param_map['start_time'])
+        end = _parse_time(param_map['end_time'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return (end - start).total_seconds()
+
+
+def _sql_value(value):
+    """ Params are stored as SQLite scalars so they compare naturally. """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _metric_rows(experiment, trial_id, res):
+    rows = []
+    for col in res.select_dtypes(include=['number']).columns:
+        if col in KEY_COLUMNS:
+            continue
+        values = res[col].dropna()
+        if values.empty:
+            continue
+        rows.append((experiment, trial_id, col, float(values.iloc[-1]),
+                     float(values.min()), float(values.max())))
+    return rows
+
+
+def index_experiment(logroot, experimentname, trial_ids=None):
+    """
+    Adds or refreshes the index entries of every trial in
+    <logroot>/<experimentname>, or only of those in `trial_ids`. Trials
+    whose result and param files are unchanged since they were last
+    indexed are skipped. Returns the number of trials (re)indexed.
+    """
+    from track.constants import METADATA_FOLDER, CONFIG_SUFFIX
+    proj_dir = os.path.join(logroot, experimentname)
+    metadata_folder = os.path.join(proj_dir, METADATA_FOLDER)
+    if not os.path.isdir(metadata_folder):
+        return 0
+    conn = _connect(logroot)
+    known = {row[0]: tuple(row[1:]) for row in conn.execute(
+        'SELECT trial_id, result_mtime, result_size, params_mtime, '
+        'params_size FROM trials '
+        'WHERE experiment = ?', (experimentname,))}
+    updated = 0
+    with conn:
+        for fname in sorted(os.listdir(metadata_folder)):
+            if not fname.endswith(CONFIG_SUFFIX):
+                continue
+            if trial_ids is not None and \
+                    fname[:-len(CONFIG_SUFFIX) - 1] not in trial_ids:
+                continue
+            params_file = os.path.join(metadata_folder, fname)
+            with open(params_file) as f:
+                param_map = json.load(f)
+            trial_id = param_map['trial_id']
+            res_file = result_file(proj_dir, trial_id)
+            if not os.path.isfile(res_file):
+                continue
+            # track writes end_time into the param file at close without
+            # touching the results, so both files are part of the key.
+            res_st, params_st = os.stat(res_file), os.stat(params_file)
+            key = (res_st.st_mtime_ns, res_st.st_size,
+                   params_st.st_mtime_ns, params_st.st_size)
+            if known.get(trial_id) == key:
+                continue
+            res = read_results(proj_dir, [trial_id])
+            ident = (experimentname, trial_id)
+            for table in ('trials', 'params', 'metrics'):
+                conn.execute('DELETE FROM {} WHERE experiment = ? '
+                             'AND trial_id = ?'.format(table), ident)
+            conn.execute('INSERT INTO trials VALUES '
+                         '(?, ?, ?, ?, ?, ?, ?, ?)',
+                         ident + (json.dumps(param_map, default=str),
+                                  _wall_time(param_map)) + key)
+            conn.executemany('INSERT INTO params VALUES (?, ?, ?, ?)',
+                             [ident + (k, _sql_value(v))
+                              for k, v in param_map.items()])
+            conn.executemany('INSERT INTO metrics VALUES (?, ?, ?, ?, ?, ?)',
+                             _metric_rows(experimentname, trial_id, res))
+            updated += 1
+    conn.close()
+    return updated
+
+
+def build_index(logroot):
+    """
+    Indexes every experiment directory under `logroot`. Safe to rerun;
+    only new or changed trials are read. Returns the number of trials
+    (re)indexed.
+    """
+    from track.constants import METADATA_FOLDER
+    return sum(index_experiment(logroot, name)
+               for name in sorted(os.listdir(logroot))
+               if os.path.isdir(os.path.join(logroot, name, METADATA_FOLDER)))
+
+
+def top_trials(logroot, metric, n=10, where=None, mode='max',
+               stat='best'):
+    """
+    Ranks indexed trials across all experiments in `logroot`.
+
+    `metric`: the metric to rank by, e.g. 'avg_test_acc'.
+    `where`: dict of param name -> required value, e.g. {'arch': 'ResNet18'}.
+    `mode`: 'max' or 'min', whether larger or smaller values are better.
+    `stat`: 'best' ranks by the best value a trial reached, 'final' by the
+    last value it logged.
+
+    Returns a DataFrame with columns experiment, trial_id, <metric>,
+    wall_time followed by the trial params.
+    """
+    import pandas as pd
+    assert mode in ('max', 'min'), "mode must be 'max' or 'min'"
+    assert stat in ('best', 'final'), "stat must be 'best' or 'final'"
+    col = mode if stat == 'best' else 'final'
+    query = ['SELECT t.experiment, t.trial_id, m.{} AS value, t.wall_time, '
+             't.params FROM metrics m JOIN trials t '
+             'USING (experiment, trial_id) '
+             'WHERE m.name = ? AND value IS NOT NULL'.format(col)]
+    args = [metric]
+    for name, value in (where or {}).items():
+        query.append('AND EXISTS (SELECT 1 FROM params p '
+                     'WHERE p.experiment = t.experiment '
+                     'AND p.trial_id = t.trial_id '
+                     'AND p.name = ? AND p.value = ?)')
+        args += [name, _sql_value(value)]
+    query.append('ORDER BY value {} LIMIT ?'.format(
+        'DESC' if mode == 'max' else 'ASC'))
+    args.append(n)
+    conn = _connect(logroot)
+    rows = conn.execute(' '.join(query), args).fetchall()
+    conn.close()
+    top = pd.DataFrame([row[:4] for row in rows],
+                       columns=['experiment', 'trial_id', metric,
+                                'wall_time'])
+    params = pd.DataFrame([json.loads(row[4]) for row in rows])
+    params = params.drop(columns=[c for c in params.columns
+                                  if c in top.columns])
+    return pd.concat([top, params], axis=1)
@@ -0,0 +1,83 @@
+""" Locating and parsing the raw track records of an experiment. """
+import concurrent.futures
+import functools
+import os
+
+
+def result_file(log_dir, trial_id):
+    """ Path of the JSON-lines result file track writes for `trial_id`. """
+    from track.constants import METADATA_FOLDER, RESULT_SUFFIX
+    return os.path.join(log_dir, METADATA_FOLDER,
+                        trial_id + '_' + RESULT_SUFFIX)
+
+
+# Columns kept by a projection even if they were not asked for.
+KEY_COLUMNS = ('trial_id', 'iteration', 'epoch')
+
+
+def _read_trial(path, columns=None, policy=None):
+    """
+    Parses one trial's records, keeping only `columns` (plus the key
+    columns) and reducing the rows with the downsampling `policy`.
+    """
+    import pandas as pd
+    df = pd.read_json(path, typ='frame', lines=True)
+    if columns is not None:
+        df = df[[c for c in df.columns
+                 if c in columns or c in KEY_COLUMNS]]
+    if policy is not None:
+        df = policy(df)
+    return df
+
+
+def _read_trial_ipc(path, columns=None, policy=None):
+    """
+    Runs in a worker process. Ships the parsed trial back as an Arrow IPC
+    stream so the parent only unpickles one flat buffer per trial.
+    """
+    import pyarrow as pa
+    df = _read_trial(path, columns, policy)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _read_parallel(paths, workers, columns, policy):
+    import pyarrow as pa
+    read = functools.partial(_read_trial_ipc, columns=columns, policy=policy)
+    chunksize = max(1, len(paths) // (4 * workers))
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        tables = [pa.ipc.open_stream(buf).read_all()
+                  for buf in pool.map(read, paths, chunksize=chunksize)]
+    if int(pa.__version__.split('.')[0]) < 14:
+        # Older pyarrow cannot widen a column that is int64 in one trial
+        # and double in another, so let pandas align the trials instead.
+        import pandas as pd
+        return pd.concat([table.to_pandas() for table in tables], axis=0,
+                         ignore_index=True, sort=False)
+    table = pa.concat_tables(tables, promote_options='permissive')
+    return table.to_pandas()
+
+
+def read_results(log_dir, trial_ids, workers=1, columns=None, policy=None):
+    """
+    Reads the result records of every trial in `trial_ids` into one frame.
+    This mirrors track.Project.results, minus the per-file assertion.
+
+    `workers`: if > 1, parse the trials in a pool of that many processes.
+    Requires pyarrow.
+    `columns`: if given, only keep these metric columns (and the key
+    columns trial_id, iteration and epoch) of each trial as it is read.
+    `policy`: a downsampling policy from skeletor.proc.downsample, applied
+    to each trial as it is read.
+    """
+    import pandas as pd
+    paths = [result_file(log_dir, trial_id) for trial_id in trial_ids]
+    if not paths:
+        return pd.DataFrame({'trial_id': []})
+    if workers > 1 and len(paths) > 1:
+        return _read_parallel(paths, workers, columns, policy)
+    dfs = [_read_trial(path, columns, policy) for path in paths]
+    return pd.concat(dfs, axis=0, ignore_index=True, sort=False)
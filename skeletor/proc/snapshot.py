@@ -0,0 +1,90 @@
+"""
+Columnar snapshots of a finished experiment.
+
+A snapshot is a directory holding two uncompressed Feather files:
+
+    trials.feather   one row per trial with its params (see track.Project.ids)
+    metrics.feather  every result row of every trial, keyed by trial_id
+
+Both are memory-mapped when read, so opening even a very large experiment
+is instant and only the columns that are actually touched get paged in.
+Requires pyarrow.
+"""
+import os
+
+from skeletor.proc.records import read_results
+from skeletor.proc.track_analysis import _param_frame, _join_params
+
+_TRIALS = 'trials.feather'
+_METRICS = 'metrics.feather'
+
+
+def snapshot_dir(experimentname, logroot):
+    """ Default snapshot location: <logroot>/<exp>/<exp>.snapshot """
+    return os.path.join(logroot, experimentname,
+                        experimentname + '.snapshot')
+
+
+def save_snapshot(track_proj, path, workers=1):
+    """
+    Writes a snapshot of the track.Project `track_proj` into directory
+    `path`. Files are written next to their final names and then renamed,
+    so a reader never sees a half-written snapshot file.
+    """
+    from pyarrow import feather
+    ids = track_proj.ids
+    metrics = read_results(track_proj.log_dir, list(ids['trial_id']),
+                           workers)
+    os.makedirs(path, exist_ok=True)
+    for fname, frame in [(_TRIALS, _param_frame(ids)), (_METRICS, metrics)]:
+        dst = os.path.join(path, fname)
+        feather.write_feather(frame.reset_index(drop=True), dst + '.tmp',
+                              compression='uncompressed')
+        os.replace(dst + '.tmp', dst)
+
+
+class Snapshot:
+    """
+    Read-only view of a snapshot directory written by `save_snapshot`.
+    The trials table is small and loaded eagerly; metric columns are read
+    from a memory map on demand.
+    """
+    def __init__(self, path):
+        from pyarrow import feather
+        self.path = path
+        self.trials = feather.read_feather(os.path.join(path, _TRIALS),
+                                           memory_map=True)
+
+    @property
+    def metric_columns(self):
+        """ names of all metric columns, read from the file schema only """
+        import pyarrow.ipc
+        with pyarrow.memory_map(os.path.join(self.path, _METRICS)) as f:
+            return pyarrow.ipc.open_file(f).schema.names
+
+    def metrics(self, columns=None):
+        """ returns the metric rows, restricted to `columns` if given """
+        from pyarrow import feather
+        if columns is not None and 'trial_id' not in columns:
+            columns = ['trial_id'] + list(columns)
+        table = feather.read_table(os.path.join(self.path, _METRICS),
+                                   columns=columns, memory_map=True)
+        return table.to_pandas()
+
+    def df(self, columns=None):
+        """ the same flattened frame as skeletor.proc.df_from_proj """
+        return _join_params(self.metrics(columns), self.trials)
+
+
+def load_snapshot(experimentname=None, logroot=None, path=None):
+    """
+    Opens the snapshot of an experiment as a `Snapshot`.
+
+    if path specified, load directly from there.
+    otherwise, load from logroot/experimentname/experimentname.snapshot.
+    """
+    if not path:
+        assert experimentname and logroot, \
+            "must supply logroot with experiment name"
+        path = snapshot_dir(experimentname, logroot)
+    return Snapshot(path)
@@ -1,26 +1,106 @@
 """ Simple tools for analyzing track results after experimentation. """
 import os
-import track
-import pandas as pd
+import numpy as np
 
+from skeletor.proc.cache import cached_results
+from skeletor.proc.downsample import as_policy, apply_per_trial
+from skeletor.proc.records import read_results, KEY_COLUMNS
 
-def df_from_proj(track_proj):
+
+def _param_frame(ids):
+    """
+    Prepares the trial parameter table for joining against results.
+    List- and dict-valued params (e.g. an annealing schedule) are
+    stringified so they can be hashed. String params become categoricals,
+    since each one only takes a handful of distinct values across a sweep;
+    numeric params stay numeric so they can still be compared and
+    averaged.
+    """
+    from pandas.api.types import is_object_dtype, is_string_dtype
+    params = ids.copy()
+    for col in params.columns:
+        if any(isinstance(v, (list, dict)) for v in params[col]):
+            params[col] = params[col].map(
+                lambda v: str(v) if isinstance(v, (list, dict)) else v)
+        dtype = params[col].dtype
+        if col != 'trial_id' and (is_object_dtype(dtype) or
+                                  is_string_dtype(dtype)):
+            params[col] = params[col].astype('category')
+    return params
+
+
+def _downcast(df):
+    """ Shrinks numeric result columns to the smallest lossless dtype. """
+    import pandas as pd
+    for col in df.select_dtypes(include=['integer']).columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in df.select_dtypes(include=['floating']).columns:
+        downcast = df[col].astype('float32')
+        if np.array_equal(downcast.values, df[col].values, equal_nan=True):
+            df[col] = downcast
+    return df
+
+
+def _join_params(res, ids):
+    """ Attaches the trial params in `ids` to every result row in `res`. """
+    # Trial params take precedence over identically named metrics.
+    overlap = [c for c in ids.columns if c in res.columns and c != 'trial_id']
+    res = _downcast(res.drop(columns=overlap))
+    params = _param_frame(ids)
+    _df = res.merge(params, on='trial_id', how='left', sort=False)
+    _df['trial_id'] = _df['trial_id'].astype('category')
+    return _df
+
+
+def df_from_proj(track_proj, cache=False, workers=1, columns=None,
+                 where=None, downsample=None):
     """
     Gets a flattened dataframe with all trial results for the track.Project
     'proj'. See track.Project for how to get this from a logroot directory.
+
+    All result files are read in a single pass and the trial params are
+    attached with one merge on `trial_id`. Param columns are categoricals
+    and numeric metric columns are downcast where that is lossless.
+
+    `cache`: if True, keep the parsed results in
+    <proj_dir>/.skeletor_cache and only re-parse trials whose result file
+    changed since the last load. See skeletor.proc.cache.
+
+    `workers`: if > 1, parse trial records in that many processes. Each
+    worker hands its trial back as an Arrow buffer (requires pyarrow).
+
+    `columns`: metric columns to keep. trial_id, iteration and epoch are
+    always kept, as are all trial params.
+
+    `where`: restricts loading to some trials. Either a query string over
+    the trial params, e.g. 'lr < 0.1 and arch == "ResNet18"', or a callable
+    taking the trial param frame and returning a boolean mask.
+
+    `downsample`: reduces each trial's rows as it is read. An int N keeps
+    every N-th iteration, 'epoch' aggregates to one row per epoch, or pass
+    a policy such as skeletor.proc.lttb(500, 'avg_train_loss').
+
+    Without `cache`, all three are applied per trial while reading, so the
+    full records are never materialized. With `cache`, they are applied to
+    the cached frame.
     """
-    results = []
-    for _, trial in track_proj.ids.iterrows():
-        res = track_proj.results([trial['trial_id']])
-        for col in track_proj.ids.columns:
-            # If the argument was a list (e.g. annealing schedule), have to
-            # stringify it to assign it as a default val for all rows.
-            if isinstance(trial[col], list):
-                trial[col] = str(trial[col])
-            res[col] = trial[col]
-        results.append(res)
-    _df = pd.concat(results)
-    return _df
+    ids = track_proj.ids
+    if where is not None:
+        ids = ids.query(where) if isinstance(where, str) else ids.loc[where]
+    trial_ids = list(ids['trial_id'])
+    policy = as_policy(downsample)
+    if cache:
+        res = cached_results(track_proj.log_dir,
+                             list(track_proj.ids['trial_id']), workers)
+        res = res[res['trial_id'].isin(trial_ids).values]
+        if columns is not None:
+            res = res[[c for c in res.columns
+                       if c in columns or c in KEY_COLUMNS]]
+        res = apply_per_trial(res, policy)
+    else:
+        res = read_results(track_proj.log_dir, trial_ids, workers,
+                           columns, policy)
+    return _join_params(res, ids)
 
 
 def proj(experimentname=None, logroot=None, s3=None,
@@ -34,6 +114,7 @@ def proj(experimentname=None, logroot=None, s3=None,
 
     loads from s3 if it can via track.
     """
+    import track
     if not proj_dir:
         if experimentname:
             assert logroot, "must supply logroot with experiment name"
@@ -0,0 +1,139 @@
+"""
+A low-overhead sampling profiler for trials.
+
+While running, a background thread wakes up every `interval` seconds and
+records the call stack of the profiled thread. The result is a set of
+folded stacks (one `frame;frame;...;leaf count` line per distinct stack),
+the input format of flamegraph.pl, speedscope and most other flame graph
+viewers.
+
+Sampling from a thread rather than from a SIGPROF handler means any thread
+can be profiled, which matters under ray where trials do not run on the
+main thread. The profiled code is only interrupted when the sampler needs
+the GIL to walk the stack.
+"""
+import collections
+import os
+import sys
+import threading
+
+PROFILE_FILE = 'profile.folded'
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of the thread that calls `start` (or of `thread_id`)
+    every `interval` seconds until `stop`. When profiling the calling
+    thread, stacks are cut at the function that started the profiler, so
+    they do not repeat the frames that led up to it.
+
+    `counts` maps each folded stack to the number of samples it was seen in.
+    """
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.counts = collections.Counter()
+        self._labels = {}
+        self._root = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = '{} ({}:{})'.format(code.co_name,
+                                        os.path.basename(code.co_filename),
+                                        code.co_firstlineno)
+            self._labels[code] = label
+        return label
+
+    def _sample(self):
+        # pylint: disable=protected-access
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            if frame is self._root:
+                break
+            frame = frame.f_back
+        if stack:
+            self.counts[';'.join(reversed(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        """ Starts sampling in a background thread. """
+        self._start(sys._getframe(1))  # pylint: disable=protected-access
+
+    def _start(self, caller):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+            self._root = caller
+        self._thread = threading.Thread(target=self._run,
+                                        name='skeletor-profiler',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops sampling. """
+        self._stop.set()
+        self._thread.join()
+        self._root = None
+
+    def save(self, path):
+        """ Writes the folded stacks to `path`. """
+        write_folded(self.counts, path)
+
+    def __enter__(self):
+        self._start(sys._getframe(1))  # pylint: disable=protected-access
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def write_folded(counts, path):
+    """ Writes a stack -> count mapping as folded stacks, atomically. """
+    with open(path + '.tmp', 'w') as f:
+        for stack, count in counts.most_common():
+            f.write('{} {}\n'.format(stack, count))
+    os.replace(path + '.tmp', path)
+
+
+def read_folded(path):
+    """ Reads folded stacks into a stack -> count Counter. """
+    counts = collections.Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                counts[stack] += int(count)
+    return counts
+
+
+def merge_profiles(experiment_dir, since=0.):
+    """
+    Sums the profiles of the trials in `experiment_dir` written at or after
+    time `since` (seconds since the epoch, to skip trials of earlier runs)
+    into `<experiment_dir>/profile.folded`. Returns the merged counts.
+    """
+    merged = collections.Counter()
+    for name in sorted(os.listdir(experiment_dir)):
+        path = os.path.join(experiment_dir, name, PROFILE_FILE)
+        if os.path.isfile(path) and os.stat(path).st_mtime >= since:
+            merged.update(read_folded(path))
+    write_folded(merged, os.path.join(experiment_dir, PROFILE_FILE))
+    return merged
+
+
+def top_functions(counts, n=20):
+    """
+    The `n` functions that were running (rather than waiting on a callee)
+    in the most samples, as (function, samples) pairs.
+    """
+    totals = collections.Counter()
+    for stack, count in counts.items():
+        totals[stack.rpartition(';')[2]] += count
+    return totals.most_common(n)
@@ -0,0 +1,74 @@
+"""
+Identifies trials by a canonical hash of their configuration so that a
+rerun of a sweep can skip what already finished.
+
+For every trial, `<logroot>/<experimentname>/.skeletor/<hash>.json` records
+the track trial directories of each attempt and whether one completed.
+"""
+import hashlib
+import json
+import os
+
+STATE_DIR = '.skeletor'
+
+# Launcher arguments that change what a trial computes. Every other
+# launcher argument only says how or where a trial runs.
+_HASHED_LAUNCHER_ARGS = ('seed',)
+# Metadata track adds to the param map.
+_TRACK_PARAMS = (
+    'trial_id', 'git_repo', 'git_hash', 'git_pretty', 'start_time',
+    'end_time', 'invocation', 'max_iteration', 'trial_completed',
+)
+
+
+def param_hash(param_map, launcher_args=()):
+    """
+    Canonical hash of a trial's resolved param map (the dict `_experiment`
+    hands to track.trial). Only `seed` and the user's own arguments count;
+    the names in `launcher_args` (the arguments skeletor's launcher adds)
+    and track's metadata are ignored.
+    """
+    params = {k: v for k, v in param_map.items()
+              if k in _HASHED_LAUNCHER_ARGS or
+              (k not in launcher_args and k not in _TRACK_PARAMS)}
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode('utf-8')).hexdigest()[:16]
+
+
+def _state_file(proj_dir, trial_hash):
+    return os.path.join(proj_dir, STATE_DIR, trial_hash + '.json')
+
+
+def trial_state(proj_dir, trial_hash):
+    """
+    Returns {'trial_dirs': [...], 'completed': bool} for the trial with
+    this hash, or None if it was never started.
+    """
+    try:
+        with open(_state_file(proj_dir, trial_hash)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(proj_dir, trial_hash, state):
+    fname = _state_file(proj_dir, trial_hash)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname + '.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(fname + '.tmp', fname)
+
+
+def mark_started(proj_dir, trial_hash, trial_dir):
+    """ Records a new attempt of the trial writing into `trial_dir`. """
+    state = trial_state(proj_dir, trial_hash) or {'trial_dirs': [],
+                                                   'completed': False}
+    state['trial_dirs'].append(os.path.abspath(trial_dir))
+    _write_state(proj_dir, trial_hash, state)
+
+
+def mark_completed(proj_dir, trial_hash):
+    """ Records that the trial ran to completion. """
+    state = trial_state(proj_dir, trial_hash)
+    state['completed'] = True
+    _write_state(proj_dir, trial_hash, state)
@@ -0,0 +1,133 @@
+"""
+Wall-time spans, exported as Chrome traces.
+
+    from skeletor.timing import span
+
+    with span('data_loading'):
+        ...
+
+    @span('evaluate')
+    def evaluate(model, loader):
+        ...
+
+Spans are only recorded while a `Tracer` is active, which skeletor does
+for every trial (and for the driver) when run with --trace. Otherwise a
+span costs one global lookup. A tracer writes `trace.json`, which can be
+opened in chrome://tracing or https://ui.perfetto.dev, and `timing.txt`,
+a table of the total and mean time per span name.
+"""
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+TRACE_FILE = 'trace.json'
+SUMMARY_FILE = 'timing.txt'
+
+# The tracer spans are recorded into, if any. See `tracing`.
+_tracer = None
+
+
+class Tracer:
+    """
+    Collects the spans of one process. Timestamps are wall clock based, so
+    the traces of several processes line up when merged.
+    """
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+        self.wall_start = time.time()
+        self._perf0 = time.perf_counter()
+
+    def add(self, name, start, end, args=None):
+        """ Records a span between two `time.perf_counter()` readings. """
+        self.events.append((name, start, end, threading.get_ident(), args))
+
+    def chrome_trace(self):
+        """ The spans as Chrome trace 'complete' events. """
+        offset = self.wall_start - self._perf0
+        return [{'name': name, 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                 'ts': (start + offset) * 1e6, 'dur': (end - start) * 1e6,
+                 'args': args or {}}
+                for name, start, end, tid, args in self.events]
+
+    def summary(self):
+        """ (name, count, total seconds, max seconds) per span name, by
+        decreasing total time. """
+        stats = collections.OrderedDict()
+        for name, start, end, _, _ in self.events:
+            count, total, longest = stats.get(name, (0, 0., 0.))
+            stats[name] = (count + 1, total + end - start,
+                           max(longest, end - start))
+        rows = [(name,) + stat for name, stat in stats.items()]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def format_summary(self):
+        """ `summary` as a text table. """
+        lines = ['{:<32} {:>8} {:>10} {:>10} {:>10}'.format(
+            'span', 'count', 'total s', 'mean ms', 'max ms')]
+        for name, count, total, longest in self.summary():
+            lines.append('{:<32} {:>8} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                name, count, total, total / count * 1e3, longest * 1e3))
+        return '\n'.join(lines)
+
+    def save(self, directory, extra_events=()):
+        """ Writes trace.json and timing.txt into `directory`. """
+        events = self.chrome_trace() + list(extra_events)
+        with open(os.path.join(directory, TRACE_FILE), 'w') as f:
+            json.dump({'traceEvents': events}, f)
+        with open(os.path.join(directory, SUMMARY_FILE), 'w') as f:
+            f.write(self.format_summary() + '\n')
+
+
+@contextlib.contextmanager
+def tracing(tracer):
+    """ Records spans into `tracer` while active; None disables tracing. """
+    global _tracer  # pylint: disable=global-statement
+    previous, _tracer = _tracer, tracer
+    try:
+        yield tracer
+    finally:
+        _tracer = previous
+
+
+def read_trace(path):
+    """ The events of a trace.json written by `Tracer.save`. """
+    with open(path) as f:
+        return json.load(f)['traceEvents']
+
+
+class span:  # pylint: disable=invalid-name
+    """
+    Times a block (as a context manager) or every call of a function (as a
+    decorator) under `name`. Keyword arguments are attached to the span in
+    the trace.
+    """
+    __slots__ = ('name', 'args', '_tracer', '_start')
+
+    def __init__(self, name, **args):
+        self.name = name
+        self.args = args
+        self._tracer = None
+        self._start = None
+
+    def __enter__(self):
+        self._tracer = _tracer
+        if self._tracer is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._tracer is not None:
+            self._tracer.add(self.name, self._start, time.perf_counter(),
+                             self.args)
+
+    def __call__(self, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with span(self.name, **self.args):
+                return fn(*args, **kwargs)
+        return timed
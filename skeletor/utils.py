@@ -1,13 +1,23 @@
 """ Various utils for random seeding, progress, and metric tracking """
-import collections
 import hashlib
+import json
+import os
 import shutil
 import sys
+import threading
 import time
 import numpy as np
 
 TOTAL_BAR_LENGTH = 65.
 
+# Held by ProgressMonitor while it writes, and taken around every fork, so
+# a worker forked mid-summary does not inherit a locked stdout.
+_write_lock = threading.Lock()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_write_lock.acquire,
+                        after_in_parent=_write_lock.release,
+                        after_in_child=_write_lock.release)
+
 term_width = shutil.get_terminal_size().columns
 
 
@@ -73,55 +83,196 @@ def format_time(seconds):
     return f
 
 
-last_time = time.time()
-begin_time = last_time
+PROGRESS_FILE = 'progress.json'
+# If set, progress is written to this file instead of stdout. See
+# `report_progress_to`.
+_progress_file = None
+# The reporter behind `progress_bar`.
+_progress = None
+
+
+class ProgressReporter:
+    """
+    Displays the progress of a loop, rendering at most `max_rate` times per
+    second however often `update` is called.
+
+    On a terminal it redraws a progress bar in place. When stdout is not a
+    terminal (e.g. a log file) it prints a compact line instead, by default
+    every 10 seconds. If `path` is set, the latest progress is written to
+    that JSON file instead, for a `ProgressMonitor` to pick up.
+    """
+    def __init__(self, max_rate=None, stream=None, path=None):
+        self.stream = stream or sys.stdout
+        self.path = path
+        isatty = getattr(self.stream, 'isatty', None)
+        self.tty = path is None and bool(isatty and isatty())
+        if max_rate is None:
+            max_rate = 4. if self.tty else 1. if path else 0.1
+        self.min_interval = 1. / max_rate
+        self._begin = self._last = time.time()
+        self._last_step = 0
+        self._next = 0.
+
+    def update(self, current, total, msg=None):
+        """
+        Reports that step `current` (counting from 0) of `total` is done.
+        `msg` is a string or a callable returning one; a callable is only
+        called when the progress is actually rendered, which keeps
+        formatting off the hot path.
+        """
+        now = time.time()
+        if current == 0:  # Reset for new bar.
+            self._begin = self._last = now
+            self._last_step = 0
+            self._next = 0.
+        done = current >= total - 1
+        if now < self._next and not done:
+            return
+        self._next = now + self.min_interval
+        if callable(msg):
+            msg = msg()
+        step_time = (now - self._last) / max(current - self._last_step, 1)
+        self._last, self._last_step = now, current
+        if self.path:
+            self._write_file(current + 1, total, step_time, now, msg)
+            return
+        if self.tty:
+            text = self._bar(current + 1, total, step_time,
+                             now - self._begin, msg, done)
+        else:
+            text = self._line(current + 1, total, step_time,
+                              now - self._begin, msg)
+        self.stream.write(text)
+        self.stream.flush()
+
+    @staticmethod
+    def _bar(current, total, step_time, tot_time, msg, done):
+        cur_len = int(TOTAL_BAR_LENGTH*current/total)
+        rest_len = max(int(TOTAL_BAR_LENGTH) - cur_len - 1, 0)
+        line = ' [{}>{}] {}/{}  Step: {} | Tot: {}'.format(
+            '=' * cur_len, '.' * rest_len, current, total,
+            format_time(step_time), format_time(tot_time))
+        if msg:
+            line += ' | ' + msg
+        return line.ljust(term_width - 1) + ('\n' if done else '\r')
+
+    @staticmethod
+    def _line(current, total, step_time, tot_time, msg):
+        line = '{}/{} ({:.0%}) | Step: {} | Tot: {}'.format(
+            current, total, current / total, format_time(step_time),
+            format_time(tot_time))
+        if msg:
+            line += ' | ' + msg
+        return line + '\n'
+
+    def _write_file(self, current, total, step_time, now, msg):
+        state = {'current': current, 'total': total, 'step_time': step_time,
+                 'elapsed': now - self._begin, 'msg': msg, 'time': now}
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(self.path + '.tmp', self.path)
+
+
+def report_progress_to(path):
+    """
+    Sends the progress shown by `progress_bar` in this process to the JSON
+    file `path` instead of stdout, or back to stdout if `path` is None.
+    skeletor does this for every trial of a --config sweep.
+    """
+    global _progress_file, _progress  # pylint: disable=global-statement
+    _progress_file = path
+    _progress = None
 
 
 def progress_bar(current, total, msg=None):
     """ handy utility to display an updating progress bar...
     percentage completed is computed as current/total
+
+    Rendering is throttled (see `ProgressReporter`), so it is cheap to call
+    on every batch. `msg` may be a callable returning the message.
+    """
+    global _progress  # pylint: disable=global-statement
+    if _progress is None:
+        _progress = ProgressReporter(path=_progress_file)
+    _progress.update(current, total, msg)
+
+
+class ProgressMonitor:
+    """
+    Prints one summary of the progress of all trials under `directory`
+    every `interval` seconds, from a background thread. Trials report
+    through progress.json files in their trial directories (see
+    `report_progress_to`).
     """
-    global last_time, begin_time  # pylint: disable=global-statement
-    if current == 0:
-        begin_time = time.time()  # Reset for new bar.
-
-    cur_len = int(TOTAL_BAR_LENGTH*current/total)
-    rest_len = int(TOTAL_BAR_LENGTH - cur_len) - 1
-
-    sys.stdout.write(' [')
-    for _ in range(cur_len):
-        sys.stdout.write('=')
-    sys.stdout.write('>')
-    for _ in range(rest_len):
-        sys.stdout.write('.')
-    sys.stdout.write(']')
-
-    cur_time = time.time()
-    step_time = cur_time - last_time
-    last_time = cur_time
-    tot_time = cur_time - begin_time
-
-    L = []
-    L.append('  Step: %s' % format_time(step_time))
-    L.append(' | Tot: %s' % format_time(tot_time))
-    if msg:
-        L.append(' | ' + msg)
-
-    msg = ''.join(L)
-    sys.stdout.write(msg)
-    for _ in range(term_width-int(TOTAL_BAR_LENGTH)-len(msg)-3):
-        sys.stdout.write(' ')
-
-    # Go back to the center of the bar.
-    for _ in range(term_width-int(TOTAL_BAR_LENGTH/2)+2):
-        sys.stdout.write('\b')
-    sys.stdout.write(' %d/%d ' % (current+1, total))
-
-    if current < total-1:
-        sys.stdout.write('\r')
-    else:
-        sys.stdout.write('\n')
-    sys.stdout.flush()
+    def __init__(self, directory, interval=10., stream=None):
+        self.directory = directory
+        self.interval = interval
+        self.stream = stream or sys.stdout
+        self._since = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _states(self):
+        states = {}
+        if not os.path.isdir(self.directory):
+            return states
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name, PROGRESS_FILE)
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if state['time'] >= self._since:
+                states[name] = state
+        return states
+
+    def summary(self):
+        """ The current summary as a string. """
+        now = time.time()
+        # Trials that have not reported for a while finished or are stuck.
+        stale = max(3 * self.interval, 30)
+        states = self._states()
+        active = {name: state for name, state in states.items()
+                  if now - state['time'] < stale}
+        lines = ['--- {} trials running, {} idle or finished ---'.format(
+            len(active), len(states) - len(active))]
+        for name, state in active.items():
+            line = '  {}  {}/{} ({:.0%}) | Step: {} | Tot: {}'.format(
+                name, state['current'], state['total'],
+                state['current'] / state['total'],
+                format_time(state['step_time']),
+                format_time(state['elapsed']))
+            if state['msg']:
+                line += ' | ' + state['msg']
+            lines.append(line)
+        return '\n'.join(lines) + '\n'
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            summary = self.summary()
+            with _write_lock:
+                self.stream.write(summary)
+                self.stream.flush()
+
+    def start(self):
+        """ Starts printing summaries. """
+        self._thread = threading.Thread(target=self._run,
+                                        name='skeletor-progress',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops printing summaries. """
+        self._stop.set()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
 
 
 def accuracy(output, target, topk=(1,)):
@@ -140,6 +291,101 @@ def accuracy(output, target, topk=(1,)):
     return res
 
 
+class ClassificationMeter:
+    """
+    Streaming top-k accuracy and confusion matrix over many batches, for
+    torch tensors or numpy arrays.
+
+    Each `update` finds the rank of the true class among the scores in one
+    vectorized pass, which yields the hits for every k at once, and adds
+    the batch to the confusion matrix. Counts stay on the device until
+    `result` or `confusion_matrix` reads them, and accuracies come from
+    total counts, so they are exact however the batch sizes vary.
+
+    `num_classes`: defaults to the width of the first batch of scores.
+    `topk`: the k to report accuracies for.
+
+    A true class tied with other classes counts as ranked ahead of them.
+    """
+    def __init__(self, num_classes=None, topk=(1,)):
+        self.num_classes = num_classes
+        self.topk = tuple(topk)
+        self.count = 0
+        self._rank_hits = None  # [r] = samples whose true class ranked r
+        self._confusion = None  # [true, predicted] over top-1 predictions
+
+    def _allocate(self, output):
+        self.num_classes = self.num_classes or output.shape[1]
+        size = (max(self.topk) + 1, self.num_classes ** 2)
+        if _is_tensor(output):
+            import torch
+            self._rank_hits, self._confusion = (
+                output.new_zeros(n, dtype=torch.long) for n in size)
+        else:
+            self._rank_hits, self._confusion = (
+                np.zeros(n, dtype=np.int64) for n in size)
+
+    def update(self, output, target):
+        """ Adds a batch of scores (batch x classes) and true labels. """
+        if self._rank_hits is None:
+            self._allocate(output)
+        maxk = max(self.topk)
+        if _is_tensor(output):
+            output, target = output.detach(), target.detach().view(-1, 1)
+            true_score = output.gather(1, target)
+            rank = (output > true_score).sum(1).clamp_(max=maxk)
+            ones = rank.new_ones(rank.shape)
+            self._rank_hits.index_add_(0, rank, ones)
+            cells = target.view(-1) * self.num_classes + output.argmax(1)
+            self._confusion.index_add_(0, cells, ones)
+        else:
+            output = np.asarray(output)
+            target = np.asarray(target).reshape(-1)
+            true_score = output[np.arange(len(target)), target]
+            rank = np.minimum((output > true_score[:, None]).sum(1), maxk)
+            self._rank_hits += np.bincount(rank, minlength=maxk + 1)
+            cells = target * self.num_classes + output.argmax(1)
+            self._confusion += np.bincount(
+                cells, minlength=self.num_classes ** 2)
+        self.count += len(target)
+
+    def _counts(self):
+        """ (rank hits, confusion) as numpy arrays, with one device sync """
+        if _is_tensor(self._rank_hits):
+            import torch
+            both = torch.cat([self._rank_hits, self._confusion]).cpu()
+            both = both.numpy()
+            return both[:len(self._rank_hits)], both[len(self._rank_hits):]
+        return self._rank_hits, self._confusion
+
+    def result(self, prefix='top'):
+        """ dict of `prefix + k` -> top-k accuracy in percent """
+        if not self.count:
+            return {'{}{}'.format(prefix, k): 0. for k in self.topk}
+        hits = np.cumsum(self._counts()[0])
+        return {'{}{}'.format(prefix, k):
+                float(100. * hits[k - 1] / self.count)
+                for k in self.topk}
+
+    def confusion_matrix(self):
+        """ (num_classes x num_classes) counts, rows are the true classes
+        and columns the top-1 predictions """
+        if self._confusion is None:
+            return None
+        return self._counts()[1].reshape(self.num_classes, self.num_classes)
+
+    def per_class_accuracy(self):
+        """ top-1 accuracy in percent of every true class """
+        confusion = self.confusion_matrix()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return 100. * np.diag(confusion) / confusion.sum(1)
+
+    def reset(self):
+        """ clears all counts """
+        self.count = 0
+        self._rank_hits = self._confusion = None
+
+
 class AverageMeter(object):
     """Computes and stores the average and current value
        Imported from
@@ -164,23 +410,319 @@ class AverageMeter(object):
         self.avg = self.sum / self.count
 
 
+def _is_tensor(value):
+    return callable(getattr(value, 'detach', None))
+
+
+def _to_floats(values):
+    """
+    Python floats of `values` (torch tensors, numpy values or numbers).
+    All tensors on one device are read with a single device sync.
+    """
+    out = list(values)
+    tensors = [i for i, v in enumerate(out) if _is_tensor(v)]
+    if tensors:
+        import torch
+        try:
+            synced = torch.stack([out[i].detach().double().reshape(())
+                                  for i in tensors]).tolist()
+        except RuntimeError:  # tensors on different devices
+            synced = [out[i].item() for i in tensors]
+        for i, value in zip(tensors, synced):
+            out[i] = value
+    return [float(v) for v in out]
+
+
+class _Meter:
+    __slots__ = ('pending', 'weights', 'sum', 'count', 'last', 'tensor')
+
+    def __init__(self):
+        self.pending = []
+        self.weights = []
+        self.sum = 0.
+        self.count = 0
+        self.last = 0.
+        self.tensor = None
+
+
+class MeterGroup:
+    """
+    Running averages of several metrics that are cheap to update on every
+    batch. Updates only queue the values: tensors stay on their device and
+    are never synchronized, and nothing is converted to a Python float
+    until a value is read.
+
+        meters = MeterGroup()
+        for inputs, targets in loader:
+            ...
+            meters.update(n=inputs.size(0), loss=loss, top1=prec1)
+        track.metric(**meters.averages())  # one device sync
+
+    Queued values are folded into the running sums with one vectorized
+    reduction per `fold_every` updates, or when a value is read.
+    """
+    __slots__ = ('_meters', 'fold_every')
+
+    def __init__(self, *names, fold_every=1024):
+        self._meters = {name: _Meter() for name in names}
+        self.fold_every = fold_every
+
+    def update(self, n=1, **values):
+        """ Adds each value in `values`, with weight `n`, to its meter. """
+        meters = self._meters
+        for name, value in values.items():
+            meter = meters.get(name)
+            if meter is None:
+                meter = meters[name] = _Meter()
+            if meter.tensor is None:  # decided by a meter's first value
+                meter.tensor = _is_tensor(value)
+            if meter.tensor:
+                value = value.detach()
+            meter.pending.append(value)
+            meter.weights.append(n)
+            meter.count += n
+            meter.last = value
+            if len(meter.pending) >= self.fold_every:
+                self._fold(meter)
+
+    @staticmethod
+    def _fold(meter):
+        """ Adds the queued values to the running sum, without syncing. """
+        if not meter.pending:
+            return
+        pending, weights = meter.pending, meter.weights
+        meter.pending, meter.weights = [], []
+        if meter.tensor:
+            import torch
+            # Weights are multiplied in as Python ints, one per distinct
+            # batch size, so no host-to-device copy is needed.
+            for n in set(weights):
+                values = [v.reshape(-1) for v, w in zip(pending, weights)
+                          if w == n]
+                meter.sum = meter.sum + torch.cat(values).double().sum() * n
+        else:
+            values = np.asarray(pending, dtype=float).reshape(len(pending))
+            meter.sum = meter.sum + float(np.dot(values, weights))
+
+    @property
+    def names(self):
+        """ names of all meters """
+        return list(self._meters)
+
+    def sum(self, name):
+        """ weighted sum of every value of meter `name` """
+        meter = self._meters[name]
+        self._fold(meter)
+        return _to_floats([meter.sum])[0]
+
+    def count(self, name):
+        """ total weight of the values of meter `name` """
+        return self._meters[name].count
+
+    def avg(self, name):
+        """ weighted average of meter `name` """
+        meter = self._meters[name]
+        return self.sum(name) / meter.count if meter.count else 0.
+
+    def val(self, name):
+        """ the last value of meter `name` """
+        return _to_floats([self._meters[name].last])[0]
+
+    def averages(self, prefix=''):
+        """ dict of `prefix + name` -> average of every meter, read with
+        a single device sync """
+        for meter in self._meters.values():
+            self._fold(meter)
+        sums = _to_floats([meter.sum for meter in self._meters.values()])
+        return {prefix + name: total / meter.count if meter.count else 0.
+                for (name, meter), total in zip(self._meters.items(), sums)}
+
+    def reset(self):
+        """ clears every meter """
+        for name in self._meters:
+            self._meters[name] = _Meter()
+
+    def __getitem__(self, name):
+        return self.avg(name)
+
+    def __contains__(self, name):
+        return name in self._meters
+
+
+def _sorted_quantiles(ordered, q):
+    """ Linearly interpolated quantiles `q` of arrays sorted along axis 0,
+    as np.quantile computes them. """
+    pos = np.asarray(q, dtype=float) * (len(ordered) - 1)
+    lo = np.floor(pos).astype(int)
+    hi = np.minimum(lo + 1, len(ordered) - 1)
+    frac = (pos - lo).reshape(pos.shape + (1,) * (ordered.ndim - 1))
+    return ordered[lo] * (1 - frac) + ordered[hi] * frac
+
+
 class RollingAverageWindow:
-    """Creates an automatically windowed rolling average."""
+    """
+    Creates an automatically windowed rolling average.
+
+    The last `window_size` values live in a preallocated numpy ring buffer,
+    so memory stays constant however long the run. The mean and variance
+    are updated in O(1) per value; quantiles, min and max sort the window
+    once per update that is followed by a query.
+    """
     def __init__(self, window_size):
         self._window_size = window_size
-        self._items = collections.deque([], window_size)
-        self._total = 0
+        self._buf = np.zeros(window_size)
+        self._count = 0
+        self._pos = 0
+        self._mean = 0.
+        self._m2 = 0.  # sum of squared deviations from the mean
+        self._sorted = None
 
     def update(self, value):
         """updates the rolling window"""
-        if len(self._items) < self._window_size:
-            self._total += value
-            self._items.append(value)
+        value = float(value)
+        if self._count < self._window_size:
+            self._count += 1
+            delta = value - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (value - self._mean)
         else:
-            self._total -= self._items.popleft()
-            self._total += value
-            self._items.append(value)
+            old = float(self._buf[self._pos])
+            mean = self._mean + (value - old) / self._count
+            self._m2 += (value - old) * (value - mean + old - self._mean)
+            self._mean = mean
+        self._buf[self._pos] = value
+        self._pos = (self._pos + 1) % self._window_size
+        self._sorted = None
+        if self._pos == 0:
+            # Recompute exactly once per lap of the buffer, so rounding
+            # errors of the incremental updates cannot pile up.
+            self._mean = float(self._buf.mean())
+            self._m2 = float(((self._buf - self._mean) ** 2).sum())
+
+    def __len__(self):
+        return self._count
 
     def value(self):
         """returns the current windowed avg"""
-        return self._total / len(self._items)
+        if not self._count:
+            raise ZeroDivisionError('the window is empty')
+        return self._mean
+
+    mean = value
+
+    def var(self, ddof=0):
+        """ windowed variance, with `ddof` delta degrees of freedom """
+        return max(self._m2, 0.) / (self._count - ddof)
+
+    def std(self, ddof=0):
+        """ windowed standard deviation """
+        return self.var(ddof) ** .5
+
+    def _ordered(self):
+        if self._sorted is None:
+            self._sorted = np.sort(self._buf[:self._count])
+        return self._sorted
+
+    def quantile(self, q):
+        """ windowed quantile(s) `q` in [0, 1], e.g. .95 for the p95 """
+        result = _sorted_quantiles(self._ordered(), q)
+        return float(result) if np.ndim(result) == 0 else result
+
+    def min(self):
+        """ smallest value in the window """
+        return float(self._ordered()[0])
+
+    def max(self):
+        """ largest value in the window """
+        return float(self._ordered()[-1])
+
+    def values(self):
+        """ the values in the window, oldest first """
+        if self._count < self._window_size:
+            return self._buf[:self._count].copy()
+        return np.roll(self._buf, -self._pos)
+
+
+class RollingWindows:
+    """
+    `RollingAverageWindow` for several series at once, e.g. the latency and
+    loss of every step. The windows share one (window_size, len(names))
+    buffer and are updated together, so every update needs a value for
+    each series. Statistics are returned as dicts of name -> value, or for
+    a single series if `name` is given.
+    """
+    def __init__(self, names, window_size):
+        self.names = list(names)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._window_size = window_size
+        self._buf = np.zeros((window_size, len(self.names)))
+        self._count = 0
+        self._pos = 0
+        self._mean = np.zeros(len(self.names))
+        self._m2 = np.zeros(len(self.names))
+        self._sorted = None
+
+    def update(self, values=None, **kwargs):
+        """
+        Adds one value per series, given as a dict (or keyword arguments)
+        by name or as a sequence in the order of `names`.
+        """
+        values = kwargs if values is None else values
+        if isinstance(values, dict):
+            values = [values[name] for name in self.names]
+        row = np.asarray(values, dtype=float)
+        if self._count < self._window_size:
+            self._count += 1
+            delta = row - self._mean
+            self._mean += delta / self._count
+            self._m2 += delta * (row - self._mean)
+        else:
+            old = self._buf[self._pos]
+            mean = self._mean + (row - old) / self._count
+            self._m2 += (row - old) * (row - mean + old - self._mean)
+            self._mean = mean
+        self._buf[self._pos] = row
+        self._pos = (self._pos + 1) % self._window_size
+        self._sorted = None
+        if self._pos == 0:
+            self._mean = self._buf.mean(axis=0)
+            self._m2 = ((self._buf - self._mean) ** 2).sum(axis=0)
+
+    def __len__(self):
+        return self._count
+
+    def _stat(self, stats, name):
+        if name is not None:
+            return float(stats[self._index[name]])
+        return dict(zip(self.names, stats.tolist()))
+
+    def mean(self, name=None):
+        """ windowed mean of each series """
+        return self._stat(self._mean, name)
+
+    def var(self, name=None, ddof=0):
+        """ windowed variance of each series """
+        return self._stat(np.maximum(self._m2, 0.) / (self._count - ddof),
+                          name)
+
+    def std(self, name=None, ddof=0):
+        """ windowed standard deviation of each series """
+        return self._stat(np.sqrt(np.maximum(self._m2, 0.) /
+                                  (self._count - ddof)), name)
+
+    def _ordered(self):
+        if self._sorted is None:
+            self._sorted = np.sort(self._buf[:self._count], axis=0)
+        return self._sorted
+
+    def quantile(self, q, name=None):
+        """ windowed quantile `q` in [0, 1] of each series """
+        return self._stat(_sorted_quantiles(self._ordered(), float(q)), name)
+
+    def min(self, name=None):
+        """ smallest value of each series in the window """
+        return self._stat(self._ordered()[0], name)
+
+    def max(self, name=None):
+        """ largest value of each series in the window """
+        return self._stat(self._ordered()[-1], name)
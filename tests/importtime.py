@@ -0,0 +1,58 @@
+#! /usr/bin/env python
+"""
+Checks that `import skeletor` stays cheap:
+
+    python tests/importtime.py [--budget_ms 500]
+
+Fails if importing skeletor takes longer than the budget (as measured by
+`python -X importtime`), or if it imports any of the heavy dependencies
+that only some code paths need.
+"""
+import argparse
+import subprocess
+import sys
+
+# Must only be imported by the code paths that use them.
+HEAVY = ('ray', 'track', 'pandas', 'pyarrow', 'yaml', 'torch')
+
+_LIST_MODULES = ('import sys, skeletor; '
+                 'print(" ".join(sorted(set(m.split(".")[0] '
+                 'for m in sys.modules))))')
+
+
+def import_time_ms():
+    """ Cumulative time of `import skeletor` in a fresh interpreter. """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                           'import skeletor'],
+                          stderr=subprocess.PIPE, universal_newlines=True,
+                          check=True)
+    for line in proc.stderr.splitlines():
+        fields = [f.strip() for f in line.split('|')]
+        if len(fields) == 3 and fields[2] == 'skeletor':
+            return int(fields[1]) / 1000
+    raise RuntimeError('no import time for skeletor in:\n' + proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget_ms', type=float, default=500)
+    args = parser.parse_args()
+
+    modules = subprocess.check_output([sys.executable, '-c', _LIST_MODULES],
+                                      universal_newlines=True).split()
+    heavy = sorted(set(modules) & set(HEAVY))
+    if heavy:
+        sys.exit('import skeletor imported {}'.format(', '.join(heavy)))
+
+    if sys.version_info < (3, 7):
+        print('-X importtime needs python 3.7, not checking the budget')
+        return
+    elapsed = import_time_ms()
+    print('import skeletor: {:.0f}ms (budget {:.0f}ms)'.format(
+        elapsed, args.budget_ms))
+    if elapsed > args.budget_ms:
+        sys.exit('import skeletor is over budget')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+A tiny experiment without torch or datasets, for tester.sh to run through
+skeletor's command-line configurations.
+
+    python ./tests/smoke.py --logroot ./tests/logs smoke
+"""
+import track
+
+import skeletor
+from skeletor.utils import progress_bar
+
+
+def add_args(parser):
+    parser.add_argument('--lr', default=0.1, type=float)
+    parser.add_argument('--steps', default=50, type=int)
+
+
+def experiment(args):
+    loss = 1.
+    for step in range(args.steps):
+        loss *= 1 - args.lr / 10
+        track.metric(iteration=step, epoch=step // 10, loss=loss,
+                     # an int in some trials and a float in others
+                     scale=1 if args.lr < 0.3 else args.lr)
+        progress_bar(step, args.steps, lambda: 'Loss: %.3f' % loss)
+    # A last record without an epoch makes this trial's epochs floats.
+    if args.lr < 0.3:
+        track.metric(iteration=args.steps, final_loss=loss)
+
+
+def postprocess(proj):
+    # Trials disagree on the dtypes of epoch and scale, which the parallel
+    # loader has to reconcile like the serial one does.
+    serial = skeletor.proc.df_from_proj(proj)
+    parallel = skeletor.proc.df_from_proj(proj, workers=2)
+    assert len(serial) == len(parallel)
+    assert serial['scale'].sum() == parallel['scale'].sum()
+
+
+if __name__ == '__main__':
+    skeletor.supply_args(add_args)
+    skeletor.supply_postprocess(postprocess)
+    skeletor.execute(experiment)
@@ -40,6 +40,15 @@ main() {
     ### Begin to add commands here!
     cmds+=("mkdir -p ./tests/logs/")
     cmds+=("rm -rf ./tests/logs/*")
+    cmds+=("python ./tests/importtime.py")
+    smoke="python ./tests/smoke.py --logroot ./tests/logs"
+    cmds+=("$smoke single")
+    cmds+=("$smoke --async_metrics async")
+    cmds+=("$smoke --trace --profile --profile_interval 1 traced")
+    cmds+=("$smoke --config ./tests/smoke.yaml --dry_run sweep")
+    cmds+=("$smoke --config ./tests/smoke.yaml --backend local --cpu --self_host 2 sweep")
+    cmds+=("$smoke --config ./tests/smoke.yaml --backend local --cpu --self_host 2 --resume sweep")
+    cmds+=("$smoke --config ./tests/smoke.yaml --backend local --cpu --self_host 2 --cpus_per_trial 0.5 --warm_workers --async_metrics --trace warm")
 
     for cmd in "${cmds[@]}"; do
         box "${cmd}"